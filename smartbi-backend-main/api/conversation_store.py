@@ -0,0 +1,132 @@
+"""
+Conversation sessions for multi-turn prompts.
+Sessions and their messages live in the database, so any worker can continue
+a session. Each model call sends the session's summary and its most recent
+messages; once those exceed the token budget, the older messages are folded
+into the summary by the model and no longer sent.
+"""
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .llm_api.models import ConversationMessage, ConversationSession
+from .rate_limit import estimate_tokens
+from .settings import CONVERSATION_KEEP_MESSAGES, CONVERSATION_TOKEN_BUDGET
+
+# Called with the current summary and the messages to fold into it; returns a Groq result dict
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[dict]]
+
+
+def count_tokens(role: str, content: str) -> int:
+    """Estimate the tokens of a message the same way the rate limiter does."""
+    return estimate_tokens([{"role": role, "content": content}], 0)
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+class ConversationStore:
+    """Reads and updates conversation sessions within a database session."""
+
+    def __init__(self, token_budget: int = CONVERSATION_TOKEN_BUDGET, keep_messages: int = CONVERSATION_KEEP_MESSAGES):
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+
+    async def create(self, db: AsyncSession, model_name: str) -> ConversationSession:
+        session = ConversationSession(
+            id=uuid.uuid4().hex,
+            model_name=model_name,
+            summary_tokens=0,
+            window_tokens=0,
+            prompt_tokens=0,
+            completion_tokens=0,
+        )
+        db.add(session)
+        await db.flush()
+        return session
+
+    async def get(self, db: AsyncSession, session_id: str) -> Optional[ConversationSession]:
+        return await db.get(ConversationSession, session_id)
+
+    async def messages(self, db: AsyncSession, session: ConversationSession, include_summarized: bool = False) -> List[ConversationMessage]:
+        """Return the session's messages in order; by default only those not yet summarized."""
+        query = select(ConversationMessage).where(ConversationMessage.session_id == session.id)
+        if not include_summarized:
+            query = query.where(ConversationMessage.summarized.is_(False))
+        return list((await db.scalars(query.order_by(ConversationMessage.id))).all())
+
+    def context(self, session: ConversationSession, window: List[ConversationMessage], prompt: str) -> List[Dict[str, str]]:
+        """Build the messages for the next model call: summary, recent messages and the new prompt.
+
+        Messages that don't fit the budget are left out, oldest first, even
+        before they are summarized.
+        """
+        budget = self.token_budget - session.summary_tokens - count_tokens("user", prompt)
+        recent = []
+        for message in reversed(window):
+            budget -= message.tokens
+            if budget < 0 and recent:
+                break
+            recent.append({"role": message.role, "content": message.content})
+        recent.reverse()
+
+        messages = [summary_message(session.summary)] if session.summary else []
+        return messages + recent + [{"role": "user", "content": prompt}]
+
+    def add_message(self, db: AsyncSession, session: ConversationSession, role: str, content: str) -> ConversationMessage:
+        message = ConversationMessage(
+            session_id=session.id,
+            role=role,
+            content=content,
+            tokens=count_tokens(role, content),
+            summarized=False,
+        )
+        db.add(message)
+        session.window_tokens += message.tokens
+        return message
+
+    @staticmethod
+    def record_usage(session: ConversationSession, result: dict) -> None:
+        session.prompt_tokens += result.get("prompt_tokens") or 0
+        session.completion_tokens += result.get("completion_tokens") or 0
+
+    async def compact(self, db: AsyncSession, session: ConversationSession, summarize: Summarizer) -> bool:
+        """Fold all but the most recent messages into the summary once the session is over budget.
+
+        Returns whether the session was summarized; if the summary call fails
+        the messages stay in the window and the next turn tries again.
+        """
+        if session.summary_tokens + session.window_tokens <= self.token_budget:
+            return False
+        window = await self.messages(db, session)
+        older = window[:-self.keep_messages] if self.keep_messages else window
+        if not older:
+            return False
+
+        result = await summarize(session.summary, [{"role": message.role, "content": message.content} for message in older])
+        self.record_usage(session, result)
+        if result.get("error"):
+            print(f"Error summarizing conversation {session.id}: {result['error']}")
+            return False
+
+        await db.execute(
+            update(ConversationMessage)
+            .where(ConversationMessage.id.in_([message.id for message in older]))
+            .values(summarized=True)
+        )
+        session.summary = result["response"]
+        session.summary_tokens = count_tokens("system", summary_message(session.summary)["content"])
+        session.window_tokens -= sum(message.tokens for message in older)
+        return True
+
+    async def delete(self, db: AsyncSession, session: ConversationSession) -> None:
+        # SQLite doesn't enforce the cascade unless foreign keys are switched on
+        await db.execute(delete(ConversationMessage).where(ConversationMessage.session_id == session.id))
+        await db.delete(session)
+
+
+# Store used by the API
+conversation_store = ConversationStore()
@@ -0,0 +1,127 @@
+"""
+Database engines and sessions shared by the API packages.
+The database is chosen with the DATABASE_URL setting: a local SQLite file by
+default, or PostgreSQL so that several backend replicas can share state.
+SQLite connections are tuned for concurrent use: WAL journaling lets readers
+run alongside a writer, and a busy timeout makes writers wait for the lock
+instead of failing with "database is locked".
+"""
+import os
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from .settings import (
+    BACKEND_DIR,
+    DATABASE_URL as CONFIGURED_DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+)
+
+Base = declarative_base()
+
+# Async driver used for each database backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def normalize_database_url(url: str) -> str:
+    """Accept the postgres:// scheme used by many hosting providers and pin the sync PostgreSQL driver."""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        url = "postgresql+psycopg2://" + url[len("postgresql://"):]
+    return url
+
+def async_database_url(url: str) -> str:
+    """Return the same database URL with the backend's async driver."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Unsupported database backend: {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+DATABASE_URL = normalize_database_url(CONFIGURED_DATABASE_URL)
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the connection-level SQLite settings to every new connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+pool_options = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+}
+
+if IS_SQLITE:
+    sync_connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    async_connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+else:
+    # Drop connections the server closed while they sat in the pool
+    pool_options["pool_pre_ping"] = True
+    sync_connect_args = {}
+    async_connect_args = {}
+
+# Synchronous engine, used by plain `def` endpoints (which FastAPI runs in a thread pool)
+engine = create_engine(DATABASE_URL, connect_args=sync_connect_args, **pool_options)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine, used by `async def` endpoints so database I/O doesn't block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=async_connect_args, **pool_options)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Dependency to get a synchronous database session
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def alembic_config():
+    """Return the Alembic configuration of the backend, pointed at DATABASE_URL."""
+    from alembic.config import Config
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    # Keep the application's logging configuration
+    config.attributes["configure_logger"] = False
+    return config
+
+# Bring the database schema up to date
+def init_db():
+    """Apply any pending migrations.
+
+    Databases created before migrations existed (by create_all) are stamped
+    with the baseline revision first, so only the later changes are applied.
+    """
+    from alembic import command
+
+    config = alembic_config()
+    with engine.connect() as connection:
+        tables = set(inspect(connection).get_table_names())
+    if "alembic_version" not in tables and "csv_data" in tables:
+        command.stamp(config, "0001")
+    command.upgrade(config, "head")
@@ -1,73 +1,196 @@
 import os
 import groq
+import httpx
 import base64
 import json
 import time
 import asyncio
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 from dotenv import load_dotenv
+from .settings import GROQ_MAX_CONNECTIONS, GROQ_MAX_KEEPALIVE_CONNECTIONS, GROQ_TIMEOUT
+from .llm_cache import ResponseCache, response_cache
+from .rate_limit import RateLimiter, rate_limiter, estimate_tokens, parse_retry_after
+from .settings import GROQ_MAX_RETRIES, CONVERSATION_MAX_TOKENS, CONVERSATION_SUMMARY_MAX_TOKENS
+from .settings import (
+    TABLE_BAND_HEIGHT,
+    TABLE_BAND_OVERLAP,
+    TABLE_EXTRACTION_MAX_CONTINUATIONS,
+    TABLE_EXTRACTION_MAX_TOKENS,
+    TABLE_IMAGE_MAX_WIDTH,
+)
+from .image_processing import image_preprocessor
+from .table_extraction import (
+    CONTINUE_PROMPT,
+    EXTRACTION_FAILED,
+    EXTRACTION_TRUNCATED,
+    TABLE_EXTRACTION_PROMPT,
+    TruncatedTableError,
+    extract_table,
+    strip_code_fences,
+)
+
+SUMMARY_PROMPT = "Summarize the conversation below for your own future reference. Keep every fact, number, decision and open question that later turns may need; leave out pleasantries. Reply with the summary only."
+
+def error_status_code(error: Exception) -> int:
+    """Map an exception raised while calling Groq to an HTTP status code."""
+    if isinstance(error, groq.RateLimitError):
+        return 429
+    if isinstance(error, ValueError):
+        return 400
+    return 502
 
 class GroqClient:
-    def __init__(self, model_name: str = "llama-3.2-90b-vision-preview"):
-        """Initialize Groq client with API key and model."""
+    def __init__(
+        self,
+        model_name: str = "llama-3.2-90b-vision-preview",
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[RateLimiter] = None
+    ):
+        """Initialize an async Groq client with a pooled HTTP connection and default model."""
         self.model_name = model_name
         load_dotenv()
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("GROQ_API_KEY environment variable not set")
         
-        self.client = groq.Client(api_key=api_key)
-        self.conversation_history: List[Dict[str, Any]] = []
+        # Keep-alive connection pool shared by every request made through this client
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=10.0)
+        )
+        # Retries are handled by _create_completion so they go through the rate limiter
+        self.client = groq.AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+        self.cache = cache if cache is not None else response_cache
+        self.rate_limiter = limiter if limiter is not None else rate_limiter
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.client.close()
+
+    async def _create_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False
+    ):
+        """Create a chat completion within the rate limit.
+
+        Rate-limit (429), connection and server errors are retried with
+        exponential backoff and jitter, honouring the retry-after header.
+        """
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        for attempt in range(GROQ_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire(model, estimated_tokens)
+            retry_after = None
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream
+                )
+            except groq.RateLimitError as e:
+                error = e
+                retry_after = parse_retry_after(e.response.headers)
+                if retry_after is not None:
+                    # Make every worker sharing the limiter back off, not just this request
+                    await self.rate_limiter.penalize(model, retry_after)
+            except (groq.APIConnectionError, groq.InternalServerError) as e:
+                error = e
+            else:
+                # Give back the part of the reservation the completion didn't use
+                usage = getattr(response, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    await self.rate_limiter.refund(model, estimated_tokens - usage.total_tokens)
+                return response
+
+            await self.rate_limiter.refund(model, estimated_tokens)
+            if attempt == GROQ_MAX_RETRIES:
+                raise error
+            delay = self.rate_limiter.backoff_delay(attempt, retry_after)
+            print(f"Groq API call failed ({str(error)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
             
     async def process_image_bytes(self, image_bytes: bytes) -> str:
         """Process an image using Groq's vision model to extract tables into CSV format."""
         try:
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-
-            message_content = [
-                {
-                    "type": "text",
-                    "text": "Extract the table from this image and convert it to CSV format. Only provide the raw CSV data without any explanations, markdown formatting, or code blocks."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}"
-                    }
-                }
-            ]
-            
-            messages = [
-                {
-                    "role": "user",
-                    "content": message_content
-                }
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=0,
-                max_tokens=4000
+            cache_key = self.cache.make_key(
+                self.model_name, TABLE_EXTRACTION_PROMPT, 0, image_bytes,
+                max_tokens=TABLE_EXTRACTION_MAX_TOKENS,
+                max_width=TABLE_IMAGE_MAX_WIDTH,
+                band_height=TABLE_BAND_HEIGHT,
+                band_overlap=TABLE_BAND_OVERLAP
             )
-            
-            csv_content = response.choices[0].message.content
-            
-            if "```" in csv_content:
-                csv_parts = csv_content.split("```")
-                for part in csv_parts:
-                    if "csv" not in part and "," in part and "\n" in part:
-                        csv_content = part.strip()
-                        break
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            # Tall images are split into bands that are extracted concurrently
+            csv_content = await extract_table(self, image_bytes)
             
             if not csv_content or "," not in csv_content:
-                return "Error: Could not extract CSV data from the image"
+                return EXTRACTION_FAILED
                 
+            await self.cache.set(cache_key, csv_content)
             return csv_content
             
+        except TruncatedTableError:
+            return EXTRACTION_TRUNCATED
         except Exception as e:
             print(f"Error processing image with Groq API: {str(e)}")
             return f"Error: {str(e)}" 
+
+    async def extract_csv(self, image_bytes: bytes, prompt: str, mime_type: str = "image/jpeg") -> str:
+        """Extract CSV from one image, asking the model to go on when its answer is cut off.
+
+        Raises TruncatedTableError if the answer is still cut off after
+        TABLE_EXTRACTION_MAX_CONTINUATIONS follow-ups.
+        """
+        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_base64}"
+                        }
+                    }
+                ]
+            }
+        ]
+
+        answer = ""
+        for _ in range(TABLE_EXTRACTION_MAX_CONTINUATIONS + 1):
+            response = await self._create_completion(
+                model=self.model_name,
+                messages=messages,
+                temperature=0,
+                max_tokens=TABLE_EXTRACTION_MAX_TOKENS
+            )
+            choice = response.choices[0]
+            content = choice.message.content or ""
+            if choice.finish_reason != "length":
+                # Fences are stripped from the whole answer: a fence opened in one piece is often closed in the next
+                return strip_code_fences(answer + content)
+            # Drop the row that was cut off; the continuation starts with it
+            answer += content[:content.rfind("\n") + 1]
+            messages = messages[:1] + [
+                {"role": "assistant", "content": answer},
+                {"role": "user", "content": CONTINUE_PROMPT}
+            ]
+        raise TruncatedTableError(EXTRACTION_TRUNCATED)
             
     async def process_text_prompt(self, prompt: str, model_name: str = None) -> dict:
         """Process a text prompt using Groq's LLM."""
@@ -76,6 +199,11 @@ class GroqClient:
             
             model = model_name if model_name else self.model_name
             
+            cache_key = self.cache.make_key(model, prompt, 0.7, max_tokens=4000)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return self._cached_result(cached, model, start_time)
+            
             messages = [
                 {
                     "role": "user",
@@ -83,7 +211,7 @@ class GroqClient:
                 }
             ]
             
-            response = self.client.chat.completions.create(
+            response = await self._create_completion(
                 model=model,
                 messages=messages,
                 temperature=0.7,
@@ -91,11 +219,14 @@ class GroqClient:
             )
             
             processing_time = int((time.time() - start_time) * 1000)  # Convert to milliseconds
+            content = response.choices[0].message.content
+            await self.cache.set(cache_key, content)
             
             return {
-                "response": response.choices[0].message.content,
+                "response": content,
                 "model_used": model,
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "cached": False
             }
             
         except Exception as e:
@@ -103,7 +234,9 @@ class GroqClient:
             return {
                 "response": f"Error: {str(e)}",
                 "model_used": model_name if model_name else self.model_name,
-                "processing_time": 0
+                "processing_time": 0,
+                "error": str(e),
+                "status_code": error_status_code(e)
             }
             
     async def process_multimodal_prompt(self, text_prompt: str, image_bytes: bytes, model_name: str = None) -> dict:
@@ -115,7 +248,14 @@ class GroqClient:
             if "vision" not in model:
                 raise ValueError("The specified model does not support vision capabilities")
             
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            cache_key = self.cache.make_key(model, text_prompt, 0.7, image_bytes, max_tokens=4000)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return self._cached_result(cached, model, start_time)
+            
+            # Downscaled and stripped of metadata, labelled with its real type
+            prepared_bytes, mime_type = await image_preprocessor.prepare(image_bytes)
+            image_base64 = base64.b64encode(prepared_bytes).decode('utf-8')
             
             message_content = [
                 {
@@ -125,7 +265,7 @@ class GroqClient:
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}"
+                        "url": f"data:{mime_type};base64,{image_base64}"
                     }
                 }
             ]
@@ -137,7 +277,7 @@ class GroqClient:
                 }
             ]
             
-            response = self.client.chat.completions.create(
+            response = await self._create_completion(
                 model=model,
                 messages=messages,
                 temperature=0.7,
@@ -145,11 +285,14 @@ class GroqClient:
             )
             
             processing_time = int((time.time() - start_time) * 1000)  # Convert to milliseconds
+            content = response.choices[0].message.content
+            await self.cache.set(cache_key, content)
             
             return {
-                "response": response.choices[0].message.content,
+                "response": content,
                 "model_used": model,
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "cached": False
             }
             
         except Exception as e:
@@ -157,20 +300,153 @@ class GroqClient:
             return {
                 "response": f"Error: {str(e)}",
                 "model_used": model_name if model_name else self.model_name,
-                "processing_time": 0
+                "processing_time": 0,
+                "error": str(e),
+                "status_code": error_status_code(e)
             }
     
-    def add_to_conversation(self, role: str, content: str):
-        """Add a message to the conversation history"""
-        self.conversation_history.append({"role": role, "content": content})
+    async def stream_text_prompt(self, prompt: str, model_name: str = None) -> AsyncIterator[str]:
+        """Stream the response to a text prompt token by token."""
+        model = model_name if model_name else self.model_name
+        messages = [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        cache_key = self.cache.make_key(model, prompt, 0.7, max_tokens=4000)
+        async for token in self._stream_completion(model, messages, cache_key):
+            yield token
+    
+    async def stream_multimodal_prompt(self, text_prompt: str, image_bytes: bytes, model_name: str = None) -> AsyncIterator[str]:
+        """Stream the response to a text prompt with an image token by token."""
+        model = model_name if model_name else self.model_name
+        if "vision" not in model:
+            raise ValueError("The specified model does not support vision capabilities")
         
-    def get_conversation_history(self) -> List[Dict[str, Any]]:
-        """Get the current conversation history"""
-        return self.conversation_history
+        prepared_bytes, mime_type = await image_preprocessor.prepare(image_bytes)
+        image_base64 = base64.b64encode(prepared_bytes).decode('utf-8')
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": text_prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_base64}"
+                        }
+                    }
+                ]
+            }
+        ]
+        cache_key = self.cache.make_key(model, text_prompt, 0.7, image_bytes, max_tokens=4000)
+        async for token in self._stream_completion(model, messages, cache_key):
+            yield token
+    
+    async def _stream_completion(self, model: str, messages: List[Dict[str, Any]], cache_key: str) -> AsyncIterator[str]:
+        """Stream a chat completion, serving and filling the response cache."""
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
         
-    def reset_conversation(self) -> None:
-        """Reset the conversation history"""
-        self.conversation_history = []
+        stream = await self._create_completion(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=4000,
+            stream=True
+        )
+        
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                parts.append(token)
+                yield token
+        
+        # Only complete answers go into the cache
+        await self.cache.set(cache_key, "".join(parts))
+    
+    @staticmethod
+    def _cached_result(response: str, model: str, start_time: float) -> dict:
+        """Build a prompt result for a response served from the cache."""
+        return {
+            "response": response,
+            "model_used": model,
+            "processing_time": int((time.time() - start_time) * 1000),
+            "cached": True
+        }
+    
+    async def process_chat(
+        self,
+        messages: List[Dict[str, Any]],
+        model_name: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = CONVERSATION_MAX_TOKENS
+    ) -> dict:
+        """Process a multi-turn conversation; the context is built by the conversation store."""
+        model = model_name if model_name else self.model_name
+        try:
+            start_time = time.time()
+            response = await self._create_completion(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            usage = getattr(response, "usage", None)
+            return {
+                "response": response.choices[0].message.content,
+                "model_used": model,
+                "processing_time": int((time.time() - start_time) * 1000),
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+                "completion_tokens": getattr(usage, "completion_tokens", 0)
+            }
+        except Exception as e:
+            print(f"Error processing conversation with Groq API: {str(e)}")
+            return {
+                "response": f"Error: {str(e)}",
+                "model_used": model,
+                "processing_time": 0,
+                "error": str(e),
+                "status_code": error_status_code(e)
+            }
+
+    async def summarize_conversation(self, summary: Optional[str], messages: List[Dict[str, str]], model_name: str = None) -> dict:
+        """Fold conversation messages into a running summary."""
+        transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        if summary:
+            transcript = f"Summary so far:\n{summary}\n\n{transcript}"
+        return await self.process_chat(
+            [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+            model_name=model_name,
+            temperature=0.2,
+            max_tokens=CONVERSATION_SUMMARY_MAX_TOKENS
+        )
+
+# Application-wide client, created on first use and closed on shutdown
+_shared_client: Optional[GroqClient] = None
+
+def get_groq_client() -> GroqClient:
+    """Return the shared GroqClient, creating it on first use."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = GroqClient()
+    return _shared_client
+
+async def close_groq_client() -> None:
+    """Close the shared GroqClient if it was created."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
 
 if __name__ == "__main__":
     async def main():
@@ -179,5 +455,6 @@ if __name__ == "__main__":
         # Example text prompt
         result = await client.process_text_prompt("What is the capital of France?")
         print(f"Response: {result['response']}")
+        await client.aclose()
         
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Image preparation for the vision model.
+Uploaded images are decoded with Pillow, turned upright according to their
+EXIF orientation, downscaled to what the model can use and re-encoded without
+metadata, as PNG for flat graphics (screenshots, charts) and JPEG otherwise.
+Tall table images are also cut into overlapping horizontal bands. The pixel
+work runs in the thread pool and its results are cached by content hash.
+"""
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .settings import IMAGE_CACHE_MAX_BYTES, IMAGE_JPEG_QUALITY, IMAGE_MAX_SIDE
+
+# Encoded image bytes and their MIME type
+EncodedImage = Tuple[bytes, str]
+
+# Leading bytes of the formats the model accepts
+SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+# Images with at most this many colours are encoded losslessly
+PNG_MAX_COLORS = 256
+
+
+def sniff_mime(image_bytes: bytes) -> Optional[str]:
+    """Return the MIME type of an image from its leading bytes, or None if unknown."""
+    for signature, mime_type in SIGNATURES:
+        if image_bytes.startswith(signature):
+            return mime_type
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def load_image(image_bytes: bytes) -> Image.Image:
+    """Decode an image and turn it upright, raising ValueError if Pillow can't read it."""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Unreadable image: {str(e)}")
+    # Phone photos are often stored sideways with an EXIF orientation tag
+    return ImageOps.exif_transpose(image)
+
+
+def fit_within(image: Image.Image, max_width: int, max_height: Optional[int] = None) -> Image.Image:
+    """Downscale an image to fit max_width (and max_height), keeping its aspect ratio."""
+    scale = max_width / image.width
+    if max_height:
+        scale = min(scale, max_height / image.height)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def encode_image(image: Image.Image, quality: int = IMAGE_JPEG_QUALITY) -> EncodedImage:
+    """Encode an image without metadata: PNG for flat graphics, JPEG for photos."""
+    buffer = io.BytesIO()
+    if image.mode in ("1", "P", "LA", "RGBA", "PA") or image.getcolors(PNG_MAX_COLORS) is not None:
+        if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def prepare_image(image_bytes: bytes, max_side: int = IMAGE_MAX_SIDE) -> EncodedImage:
+    """Downscale and re-encode an image for the model.
+
+    Images Pillow can't read are passed through with their sniffed type. An
+    image that needs no resizing and carries no metadata is kept as is when
+    re-encoding wouldn't make it smaller.
+    """
+    original_mime = sniff_mime(image_bytes)
+    try:
+        source = Image.open(io.BytesIO(image_bytes))
+        has_metadata = bool(source.info.get("exif") or source.info.get("xmp") or source.getexif())
+        image = load_image(image_bytes)
+    except (ValueError, UnidentifiedImageError, OSError):
+        return image_bytes, original_mime or "image/jpeg"
+
+    resized = fit_within(image, max_side, max_side)
+    encoded = encode_image(resized)
+    if resized is image and not has_metadata and original_mime and len(image_bytes) <= len(encoded[0]):
+        return image_bytes, original_mime
+    return encoded
+
+
+def split_into_bands(image_bytes: bytes, max_width: int, band_height: int, overlap: int) -> List[EncodedImage]:
+    """Downscale an image and cut it into overlapping horizontal bands, top to bottom."""
+    image = fit_within(load_image(image_bytes), max_width)
+    return [
+        encode_image(image.crop((0, top, image.width, bottom)))
+        for top, bottom in band_boxes(image.height, band_height, overlap)
+    ]
+
+
+def band_boxes(height: int, band_height: int, overlap: int) -> List[Tuple[int, int]]:
+    """Split a height into evenly sized bands of at most band_height that overlap by `overlap`.
+
+    Images up to a quarter taller than one band are not split.
+    """
+    if height <= band_height * 1.25 or band_height <= overlap:
+        return [(0, height)]
+    count = -(-(height - overlap) // (band_height - overlap))  # Ceiling division
+    step = (height - overlap) / count
+    return [(round(i * step), min(height, round((i + 1) * step + overlap))) for i in range(count)]
+
+
+class ImagePreprocessor:
+    """Runs image preparation in the thread pool, caching results by content hash."""
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # key -> list of encoded images
+        self._entries: "OrderedDict[str, List[EncodedImage]]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def prepare(self, image_bytes: bytes) -> EncodedImage:
+        """Downscale and re-encode an image for a multimodal prompt."""
+        images = await self._cached(image_bytes, ("prepare", IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY), lambda: [prepare_image(image_bytes)])
+        return images[0]
+
+    async def split_into_bands(self, image_bytes: bytes, max_width: int, band_height: int, overlap: int) -> List[EncodedImage]:
+        """Downscale a table image and cut it into bands (see split_into_bands)."""
+        return await self._cached(
+            image_bytes,
+            ("bands", max_width, band_height, overlap, IMAGE_JPEG_QUALITY),
+            lambda: split_into_bands(image_bytes, max_width, band_height, overlap)
+        )
+
+    async def _cached(self, image_bytes: bytes, params: tuple, compute: Callable[[], List[EncodedImage]]) -> List[EncodedImage]:
+        key = hashlib.sha256(image_bytes).hexdigest() + repr(params)
+        images = self._entries.get(key)
+        if images is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return images
+        self.misses += 1
+
+        images = await run_in_threadpool(compute)
+        size = sum(len(data) for data, _ in images)
+        # Another request may have prepared the same image meanwhile
+        if key not in self._entries and size <= self.max_bytes:
+            self._entries[key] = images
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= sum(len(data) for data, _ in evicted)
+        return images
+
+
+# Preprocessor shared by every request in the process
+image_preprocessor = ImagePreprocessor()
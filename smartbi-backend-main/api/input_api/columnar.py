@@ -0,0 +1,77 @@
+"""
+Typed columnar (Parquet) copies of stored CSV files.
+pyarrow is optional; without it no columnar copies are written.
+"""
+import os
+from typing import Dict, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the installation
+    pa = None
+
+from ..storage import csv_store
+
+PARQUET_SUFFIX = ".parquet"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Type inference looks at the first block only, so make it reasonably large
+INFERENCE_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def columnar_available() -> bool:
+    """Return True if columnar copies can be written in this installation."""
+    return pa is not None
+
+
+def _convert(csv_path: str, parquet_path: str, column_types: Optional[Dict] = None):
+    """Convert a CSV file to Parquet batch by batch and return the schema."""
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=INFERENCE_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types),
+    )
+    tmp_path = f"{parquet_path}.tmp"
+    try:
+        with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return reader.schema
+
+
+def write_columnar_copy(content_hash: str) -> Optional[Dict[str, str]]:
+    """Write a Parquet copy of a stored CSV and return its column dtypes.
+
+    Returns None when pyarrow is unavailable or the file cannot be converted.
+    """
+    if not columnar_available():
+        return None
+
+    csv_path = csv_store.path_for(content_hash)
+    parquet_path = csv_store.path_for(content_hash, PARQUET_SUFFIX)
+    try:
+        if os.path.exists(parquet_path):
+            schema = pq.read_schema(parquet_path)
+        else:
+            try:
+                schema = _convert(csv_path, parquet_path)
+            except pa.ArrowInvalid:
+                # A later block disagreed with the inferred types; keep every column as text
+                header = pa_csv.open_csv(csv_path).schema.names
+                schema = _convert(csv_path, parquet_path, {name: pa.string() for name in header})
+    except (pa.ArrowInvalid, OSError) as e:
+        print(f"Could not write columnar copy for {content_hash}: {str(e)}")
+        return None
+
+    return {field.name: str(field.type) for field in schema}
+
+
+def columnar_path(content_hash: str) -> str:
+    """Return the path of the Parquet copy of a stored CSV."""
+    return csv_store.path_for(content_hash, PARQUET_SUFFIX)
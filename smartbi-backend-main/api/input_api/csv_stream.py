@@ -0,0 +1,86 @@
+"""
+Incremental CSV validation for streamed uploads.
+"""
+import codecs
+import csv
+import io
+
+from ..settings import CSV_MAX_RECORD_SIZE
+
+
+def find_record_boundary(text: str) -> int:
+    """Return the offset just past the last complete CSV record in text.
+
+    A newline only ends a record when it is outside a quoted field, i.e. when an
+    even number of quote characters precede it since the start of the text.
+    """
+    in_quotes = False
+    position = 0
+    boundary = 0
+    # The last piece has no trailing newline, so it can never complete a record
+    for line in text.split("\n")[:-1]:
+        position += len(line) + 1
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            boundary = position
+    return boundary
+
+
+class CSVStreamValidator:
+    """Validates a CSV file chunk by chunk while it is being uploaded."""
+
+    def __init__(self, encoding: str = "utf-8", max_record_size: int = CSV_MAX_RECORD_SIZE):
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._pending = ""
+        self.max_record_size = max_record_size
+        self.row_count = 0
+
+    def feed(self, chunk: bytes, final: bool = False) -> None:
+        """Decode and parse the next chunk of the file.
+
+        Raises UnicodeDecodeError or csv.Error if the data is not a valid CSV,
+        including when a record grows past max_record_size.
+        """
+        text = self._pending + self._decoder.decode(chunk, final)
+        if final:
+            complete, self._pending = text, ""
+        else:
+            boundary = find_record_boundary(text)
+            complete, self._pending = text[:boundary], text[boundary:]
+            # Keeps memory bounded when a quote is never closed
+            if len(self._pending) > self.max_record_size:
+                raise csv.Error(f"A record is longer than {self.max_record_size} characters (unbalanced quote?)")
+
+        if complete:
+            for row in csv.reader(io.StringIO(complete, newline="")):
+                if row:
+                    self.row_count += 1
+
+
+def iter_records(fileobj, chunk_size: int):
+    """Yield the raw bytes of each CSV record in a binary file, newline included.
+
+    Quoted fields may contain newlines, so physical lines are grouped until the
+    quote count of the record is balanced.
+    """
+    pending = b""
+    record = []
+    in_quotes = False
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            record.append(line + b"\n")
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if not in_quotes:
+                yield b"".join(record)
+                record = []
+    if pending:
+        record.append(pending)
+    if record:
+        yield b"".join(record)
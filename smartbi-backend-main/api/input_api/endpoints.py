@@ -1,99 +1,147 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List, Dict, Optional
 import io
 import csv
+import json
 import os
 from .schemas import CSVInput, CSVResponse
-from sqlalchemy.orm import Session
-from ..groq_client import GroqClient  # Use relative import
+from .csv_stream import CSVStreamValidator
+from .columnar import write_columnar_copy, columnar_path, PARQUET_MEDIA_TYPE
+from .streaming import (
+    RangeNotSatisfiable,
+    compress_stream,
+    iter_file_range,
+    iter_row_page,
+    negotiate_encoding,
+    parse_range,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from ..groq_client import GroqClient, get_groq_client, EXTRACTION_FAILED, EXTRACTION_TRUNCATED  # Use relative import
+from ..settings import UPLOAD_CHUNK_SIZE
+from ..storage import csv_store, image_store
+from ..jobs_api.queue import enqueue_response, job_handler
 
 router = APIRouter()
 
 # Check if running on Vercel
 
 # In-memory storage for Vercel deployment
-from .models import CSVData, SessionLocal, init_db
-# Initialize the database when not on Vercel
-init_db()
-
-# Dependency to get the database session or in-memory store
-def get_db():
-
-    # Use SQLite for local development
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from .models import CSVData
+from ..database import get_db, get_async_db
 
 @router.post("/upload-csv/", response_model=CSVResponse)
-async def upload_csv(file: UploadFile = File(...), db: Optional[Session] = Depends(get_db)):
+async def upload_csv(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
     """Upload a CSV file and store its content."""
-    global next_id
-    
-    # Read CSV content from the uploaded file
-    contents = await file.read()
+    validator = CSVStreamValidator()
     try:
-        # Try to decode as text
-        csv_content = contents.decode('utf-8')
-        
-        # Validate that it's a proper CSV
-        csv_reader = csv.reader(io.StringIO(csv_content))
-        list(csv_reader)  # Attempt to read the CSV to validate format
-        
-        
-        csv_data = CSVData(
-            filename=file.filename,
-            content=csv_content,
-            source_type="direct_upload"
-        )
-        db.add(csv_data)
-        db.commit()
-        db.refresh(csv_data)
-        
-        return {
-            "id": csv_data.id,
-            "filename": csv_data.filename,
-            "source_type": csv_data.source_type
-        }
-    except Exception as e:
+        # Stream the upload into the content store, validating rows as they arrive
+        with csv_store.writer() as writer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                validator.feed(chunk)
+                writer.write(chunk)
+            validator.feed(b"", final=True)
+            content_hash = writer.commit()
+            size_bytes = writer.size
+    except (UnicodeDecodeError, csv.Error) as e:
         raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
 
+    # Write a typed columnar copy so later consumers don't have to re-parse the CSV
+    columnar_dtypes = await run_in_threadpool(write_columnar_copy, content_hash)
+
+    csv_data = CSVData(
+        filename=file.filename,
+        source_type="direct_upload",
+        content_hash=content_hash,
+        size_bytes=size_bytes,
+        row_count=validator.row_count,
+        columnar_dtypes=json.dumps(columnar_dtypes) if columnar_dtypes else None
+    )
+    db.add(csv_data)
+    await db.commit()
+    await db.refresh(csv_data)
+
+    return {
+        "id": csv_data.id,
+        "filename": csv_data.filename,
+        "source_type": csv_data.source_type,
+        "columnar_dtypes": csv_data.get_columnar_dtypes()
+    }
+
+async def extract_image_csv(image_data: bytes, filename: str, db: AsyncSession, groq_client: GroqClient) -> dict:
+    """Extract the table in an image and store it as a CSV (flushed, the caller commits)."""
+    # Process image using the shared Groq client
+    csv_data_content = await groq_client.process_image_bytes(image_data)
+    
+    if not csv_data_content or csv_data_content == EXTRACTION_FAILED:
+        raise HTTPException(
+            status_code=400, 
+            detail="Failed to extract CSV data from the image"
+        )
+    if csv_data_content == EXTRACTION_TRUNCATED:
+        # Storing part of the table would silently lose rows
+        raise HTTPException(status_code=422, detail=csv_data_content)
+    if csv_data_content.startswith("Error:"):
+        # The model call itself failed; don't store the error text as CSV
+        raise HTTPException(status_code=502, detail=csv_data_content)
+    
+
+    # Store the extracted CSV in the content store, keeping only metadata in the database
+    csv_bytes = csv_data_content.encode("utf-8")
+    validator = CSVStreamValidator()
+    validator.feed(csv_bytes, final=True)
+    content_hash = csv_store.put_bytes(csv_bytes)
+    columnar_dtypes = await run_in_threadpool(write_columnar_copy, content_hash)
+    csv_data = CSVData(
+        filename=f"{filename}_extracted.csv",
+        source_type="image_conversion",
+        content_hash=content_hash,
+        size_bytes=len(csv_bytes),
+        row_count=validator.row_count,
+        columnar_dtypes=json.dumps(columnar_dtypes) if columnar_dtypes else None
+    )
+    db.add(csv_data)
+    await db.flush()
+    
+    return {
+        "id": csv_data.id,
+        "filename": csv_data.filename,
+        "source_type": csv_data.source_type,
+        "columnar_dtypes": csv_data.get_columnar_dtypes()
+    }
+
+@job_handler("upload_image")
+async def upload_image_job(payload: dict, db: AsyncSession) -> dict:
+    """Run an upload_image request queued with background=true."""
+    with image_store.open(payload["image_hash"]) as image_file:
+        image_data = image_file.read()
+    return await extract_image_csv(image_data, payload["filename"], db, get_groq_client())
+
 @router.post("/upload-image/", response_model=CSVResponse)
-async def upload_image(image: UploadFile = File(...), db: Optional[Session] = Depends(get_db)):
+async def upload_image(
+    image: UploadFile = File(...),
+    background: bool = Query(False, description="Return 202 with a job id at once and extract in the background"),
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
+):
     """Process an image and extract CSV data."""
-    global next_id
-    
     try:
         # Read image data without saving to disk
         image_data = await image.read()
         
-        # Process image using Groq client
-        groq_client = GroqClient()
-        csv_data_content = await groq_client.process_image_bytes(image_data)
-        
-        if not csv_data_content:
-            raise HTTPException(
-                status_code=400, 
-                detail="Failed to extract CSV data from the image"
-            )
-        
-    
-        # Store CSV content in database for local development
-        csv_data = CSVData(
-            filename=f"{image.filename}_extracted.csv",
-            content=csv_data_content,
-            source_type="image_conversion"
-        )
-        db.add(csv_data)
-        db.commit()
-        db.refresh(csv_data)
+        if background:
+            # Queued jobs read the image back from the image store
+            payload = {"image_hash": image_store.put_bytes(image_data), "filename": image.filename}
+            return await enqueue_response(db, "upload_image", payload)
         
-        return {
-            "id": csv_data.id,
-            "filename": csv_data.filename,
-            "source_type": csv_data.source_type
-        }
+        result = await extract_image_csv(image_data, image.filename, db, groq_client)
+        await db.commit()
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -114,27 +162,117 @@ def get_csv_info(csv_id: int, db: Optional[Session] = Depends(get_db)):
     return {
         "id": csv_data.id,
         "filename": csv_data.filename,
-        "source_type": csv_data.source_type
+        "source_type": csv_data.source_type,
+        "columnar_dtypes": csv_data.get_columnar_dtypes()
     }
 
+@router.get("/csv/{csv_id}/columnar")
+def get_csv_columnar(csv_id: int, db: Optional[Session] = Depends(get_db)):
+    """Get the typed Parquet copy of a stored CSV file."""
+    csv_data = db.query(CSVData).filter(CSVData.id == csv_id).first()
+    if not csv_data:
+        raise HTTPException(status_code=404, detail="CSV data not found")
+
+    if not csv_data.content_hash or not csv_data.columnar_dtypes:
+        raise HTTPException(status_code=404, detail="No columnar copy available for this CSV")
+
+    filename = f"{os.path.splitext(csv_data.filename or 'data')[0]}.parquet"
+    return FileResponse(columnar_path(csv_data.content_hash), media_type=PARQUET_MEDIA_TYPE, filename=filename)
+
 @router.get("/csv/{csv_id}/content")
-def get_csv_content(csv_id: int, db: Optional[Session] = Depends(get_db)):
-    """Get the content of a stored CSV file."""
-    
+def get_csv_content(
+    csv_id: int,
+    request: Request,
+    offset: Optional[int] = Query(None, ge=0, description="Index of the first data row to return"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of data rows to return"),
+    db: Optional[Session] = Depends(get_db)
+):
+    """Stream the content of a stored CSV file as text/csv.
 
+    Supports HTTP Range requests, row pagination through offset/limit (the
+    header row is always included) and gzip/zstd encoding via Accept-Encoding.
+    """
     csv_data = db.query(CSVData).filter(CSVData.id == csv_id).first()
     if not csv_data:
         raise HTTPException(status_code=404, detail="CSV data not found")
-    
-    return {"content": csv_data.content}
+
+    content_file = csv_data.open_content()
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if csv_data.row_count:
+        headers["X-Total-Rows"] = str(max(csv_data.row_count - 1, 0))
+
+    if offset is not None or limit is not None:
+        chunks = iter_row_page(content_file, offset or 0, limit, UPLOAD_CHUNK_SIZE)
+    else:
+        headers["Accept-Ranges"] = "bytes"
+        size = content_file.seek(0, os.SEEK_END)
+        byte_range = None
+        range_header = request.headers.get("range")
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                content_file.close()
+                raise HTTPException(
+                    status_code=416,
+                    detail="Requested range not satisfiable",
+                    headers={"Content-Range": f"bytes */{size}"}
+                )
+
+        if byte_range:
+            # Ranges refer to the stored bytes, so partial responses are never compressed
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                iter_file_range(content_file, start, end, UPLOAD_CHUNK_SIZE),
+                status_code=206,
+                media_type="text/csv",
+                headers=headers
+            )
+
+        chunks = iter_file_range(content_file, 0, size - 1, UPLOAD_CHUNK_SIZE)
+        if not encoding:
+            headers["Content-Length"] = str(size)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return StreamingResponse(
+        compress_stream(chunks, encoding),
+        media_type="text/csv",
+        headers=headers
+    )
 
 @router.get("/csv/", response_model=List[CSVResponse])
-def list_all_csvs(db: Optional[Session] = Depends(get_db)):
-    """List all stored CSV files."""
-    
+def list_all_csvs(
+    response: Response,
+    after_id: Optional[int] = Query(None, description="Return CSVs with an id greater than this cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Optional[Session] = Depends(get_db)
+):
+    """List stored CSV files, paginated by id.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    # Only load the metadata columns, never the (legacy) content column
+    query = db.query(CSVData).options(
+        load_only(CSVData.id, CSVData.filename, CSVData.source_type, CSVData.columnar_dtypes)
+    )
+    if after_id is not None:
+        query = query.filter(CSVData.id > after_id)
+    csv_data = query.order_by(CSVData.id).limit(limit).all()
+
+    if len(csv_data) == limit:
+        response.headers["X-Next-Cursor"] = str(csv_data[-1].id)
 
-    csv_data = db.query(CSVData).all()
     return [
-        {"id": data.id, "filename": data.filename, "source_type": data.source_type}
+        {
+            "id": data.id,
+            "filename": data.filename,
+            "source_type": data.source_type,
+            "columnar_dtypes": data.get_columnar_dtypes()
+        }
         for data in csv_data
-    ] 
\ No newline at end of file
+    ]
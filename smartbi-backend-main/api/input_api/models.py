@@ -1,26 +1,28 @@
-from sqlalchemy import Column, Integer, String, Text, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-
-Base = declarative_base()
+from sqlalchemy import Column, Integer, String, Text
+import io
+import json
+from ..storage import csv_store
+# Engine and sessions live in api.database; re-exported here for existing imports
+from ..database import Base, engine, SessionLocal, AsyncSessionLocal, init_db
 
 class CSVData(Base):
     __tablename__ = 'csv_data'
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    content = Column(Text)  # Store CSV content directly in the database
+    content = Column(Text, nullable=True)  # Legacy rows only; new uploads live in the content store
     source_type = Column(String)  # 'direct_upload' or 'image_conversion'
+    content_hash = Column(String(64), index=True, nullable=True)  # SHA-256 of the file in csv_store
+    size_bytes = Column(Integer, nullable=True)  # Size of the stored file in bytes
+    row_count = Column(Integer, nullable=True)  # Number of non-empty rows, including the header
+    columnar_dtypes = Column(Text, nullable=True)  # JSON column -> dtype map; set once a Parquet copy exists
 
-# Ensure the database file is created in the api directory
-database_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database.db")
-DATABASE_URL = f"sqlite:///{database_path}"  # SQLite database file
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def open_content(self):
+        """Open the stored CSV as a binary file object."""
+        if self.content_hash:
+            return csv_store.open(self.content_hash)
+        return io.BytesIO((self.content or "").encode("utf-8"))
 
-# Create the database tables
-def init_db():
-    # Drop existing tables and recreate them
-    Base.metadata.create_all(bind=engine)  # This creates new tables 
\ No newline at end of file
+    def get_columnar_dtypes(self):
+        """Return the dtypes of the Parquet copy, or None if there is no copy."""
+        return json.loads(self.columnar_dtypes) if self.columnar_dtypes else None
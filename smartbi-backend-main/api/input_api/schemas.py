@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional
 
 class CSVInput(BaseModel):
     filename: str
@@ -9,6 +9,7 @@ class CSVResponse(BaseModel):
     id: int
     filename: str
     source_type: str
+    columnar_dtypes: Optional[Dict[str, str]] = None  # Inferred dtypes of the Parquet copy, if any
 
     class Config:
         orm_mode = True
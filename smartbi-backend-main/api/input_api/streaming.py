@@ -0,0 +1,113 @@
+"""
+Helpers for streaming stored CSV files over HTTP: byte ranges, row pages and
+on-the-fly compression.
+"""
+import re
+import zlib
+from typing import Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd support is optional
+    zstandard = None
+
+from .csv_stream import iter_records
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header does not fit the file."""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range "bytes=start-end" header into inclusive offsets.
+
+    Returns None for headers we don't support (e.g. multiple ranges), in which
+    case the whole file should be served.
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content encoding from an Accept-Encoding header."""
+    offered = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        offered.add(name.strip().lower())
+
+    if "zstd" in offered and zstandard is not None:
+        return "zstd"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def iter_file_range(fileobj, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    """Yield the bytes between two inclusive offsets of a file and close it."""
+    with fileobj:
+        fileobj.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fileobj.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_row_page(fileobj, offset: int, limit: Optional[int], chunk_size: int) -> Iterator[bytes]:
+    """Yield the header record followed by `limit` data records starting at `offset`."""
+    with fileobj:
+        records = (record for record in iter_records(fileobj, chunk_size) if record.strip())
+        header = next(records, None)
+        if header is None:
+            return
+        yield header
+
+        index = 0
+        for record in records:
+            if limit is not None and index >= offset + limit:
+                break
+            if index >= offset:
+                yield record
+            index += 1
+
+
+def compress_stream(chunks: Iterator[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a stream of chunks with gzip or zstd (or pass it through)."""
+    if encoding is None:
+        yield from chunks
+        return
+
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        # wbits=31 produces a gzip container rather than a raw zlib stream
+        compressor = zlib.compressobj(wbits=31)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
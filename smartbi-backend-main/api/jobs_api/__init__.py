@@ -0,0 +1,5 @@
+"""
+Jobs API module for running slow requests in the background.
+Endpoints that accept background=true enqueue a job and return 202; this
+module provides the endpoints to follow, fetch and cancel jobs.
+"""
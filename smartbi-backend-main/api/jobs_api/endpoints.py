@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import AsyncIterator
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Job
+from .queue import FINISHED_STATUSES, cancel, job_response
+from .schemas import JobResponse
+from ..database import AsyncSessionLocal, get_async_db
+from ..llm_api.endpoints import event_stream_response, sse_event
+from ..settings import JOB_POLL_INTERVAL
+
+router = APIRouter()
+
+async def get_job_or_404(job_id: str, db: AsyncSession) -> Job:
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get the status of a background job, with its result once it succeeded."""
+    return job_response(await get_job_or_404(job_id, db))
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get what the request would have returned if it had not run in the background.
+
+    Answers 202 with the job while it is still queued or running, and a failed
+    job's error with the status code the request would have failed with.
+    """
+    job = await get_job_or_404(job_id, db)
+    if job.status == "succeeded":
+        return job.get_result()
+    if job.status == "failed":
+        raise HTTPException(status_code=job.status_code or 500, detail=job.error)
+    if job.status == "cancelled":
+        raise HTTPException(status_code=409, detail="Job was cancelled")
+    return JSONResponse(status_code=202, content=jsonable_encoder(job_response(job)))
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Cancel a background job.
+
+    A queued job is cancelled at once; a running one stops within about
+    JOB_POLL_INTERVAL seconds. Finished jobs are left as they are.
+    """
+    job = await get_job_or_404(job_id, db)
+    return job_response(await cancel(db, job))
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Follow a background job as Server-Sent Events.
+
+    Sends a "status" event with the job whenever its status or attempt
+    changes, and a final "done" event with the finished job.
+    """
+    await get_job_or_404(job_id, db)
+
+    async def events() -> AsyncIterator[str]:
+        last_state = None
+        while True:
+            # Jobs are updated by other sessions (and processes), so read a fresh copy each time
+            async with AsyncSessionLocal() as poll_db:
+                job = await poll_db.get(Job, job_id)
+            if job is None:
+                yield sse_event("error", {"detail": "Job not found"})
+                return
+            payload = jsonable_encoder(job_response(job))
+            if job.status in FINISHED_STATUSES:
+                yield sse_event("done", payload)
+                return
+            if (job.status, job.attempts) != last_state:
+                last_state = (job.status, job.attempts)
+                yield sse_event("status", payload)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return event_stream_response(events())
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index, text
+from datetime import datetime
+import json
+from ..database import Base
+
+class Job(Base):
+    """Model for a background job: a slow request run by the job workers."""
+    __tablename__ = 'jobs'
+
+    id = Column(String(32), primary_key=True)  # Random hex id handed to the client
+    kind = Column(String, nullable=False)  # Handler that runs the job, e.g. 'upload_image'
+    request_hash = Column(String(64), nullable=False)  # SHA-256 of the kind and payload, for deduplication
+    payload = Column(Text, nullable=False)  # JSON arguments of the handler
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed or cancelled
+    result = Column(Text, nullable=True)  # JSON result of a succeeded job
+    error = Column(Text, nullable=True)
+    status_code = Column(Integer, nullable=True)  # HTTP status the request would have failed with
+    attempts = Column(Integer, default=0, nullable=False)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    worker_id = Column(String, nullable=True)  # Worker holding the lease of a running job
+    available_at = Column(DateTime, nullable=False)  # Not claimed before this time (retry backoff)
+    lease_expires_at = Column(DateTime, nullable=True)  # A running job whose lease expired is claimed again
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Serves claiming the next job
+        Index("ix_jobs_status_available_at", "status", "available_at"),
+        Index("ix_jobs_request_hash", "request_hash"),
+        # At most one queued or running job per request, even for requests that arrive together
+        Index(
+            "ux_jobs_active_request_hash", "request_hash",
+            unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    def get_payload(self) -> dict:
+        return json.loads(self.payload)
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
@@ -0,0 +1,327 @@
+"""
+Background job queue.
+Jobs are rows of the jobs table, so they survive restarts and every worker
+process shares one queue. Each process runs JOB_WORKERS worker tasks that
+claim jobs with a conditional UPDATE (a job is only ever claimed once), hold
+a lease they renew while the job runs, and commit the job's result in the
+same transaction as the handler's own writes. A job whose worker died is
+claimed again once its lease expires, so handlers must be safe to re-run.
+Identical requests within JOB_DEDUPE_SECONDS share one job.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal
+from ..settings import (
+    JOB_DEDUPE_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_RETRY_DELAY,
+    JOB_WORKERS,
+)
+from .models import Job
+from .schemas import JobResponse
+
+# A handler gets the job's payload and a database session and returns a JSON-serializable result.
+# It must not commit: its writes are committed together with the job's result.
+JobHandler = Callable[[dict, AsyncSession], Awaitable[Any]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+def job_handler(kind: str):
+    """Register the handler that runs jobs of a kind."""
+    def register(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def request_hash(kind: str, payload: dict) -> str:
+    return hashlib.sha256(json.dumps({"kind": kind, "payload": payload}, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def job_response(job: Job) -> JobResponse:
+    """Serialize a job, with its result once it succeeded."""
+    return JobResponse(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        error=job.error,
+        status_code=job.status_code,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result=job.get_result(),
+    )
+
+
+async def enqueue(db: AsyncSession, kind: str, payload: dict) -> Tuple[Job, bool]:
+    """Queue a job, or return the recent job for the same request.
+
+    Returns the job and whether it was created. Jobs that failed or were
+    cancelled are not reused, so a retry after a failure runs again.
+    """
+    digest = request_hash(kind, payload)
+    now = datetime.utcnow()
+    existing = await db.scalar(
+        select(Job)
+        .where(
+            Job.request_hash == digest,
+            Job.status.in_(ACTIVE_STATUSES + ("succeeded",)),
+            Job.created_at >= now - timedelta(seconds=JOB_DEDUPE_SECONDS),
+        )
+        .order_by(Job.created_at.desc())
+        .limit(1)
+    )
+    if existing is not None:
+        return existing, False
+
+    job = Job(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        request_hash=digest,
+        payload=json.dumps(payload),
+        status="queued",
+        attempts=0,
+        cancel_requested=False,
+        available_at=now,
+        created_at=now,
+    )
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # An identical request was queued between the lookup and the insert
+        # (the jobs table allows one active job per request hash)
+        await db.rollback()
+        existing = await db.scalar(
+            select(Job).where(Job.request_hash == digest, Job.status.in_(ACTIVE_STATUSES))
+        )
+        if existing is None:
+            raise
+        return existing, False
+    job_queue.notify()
+    return job, True
+
+
+async def enqueue_response(db: AsyncSession, kind: str, payload: dict) -> JSONResponse:
+    """Queue a job and answer 202 Accepted with the job and where to follow it."""
+    job, _ = await enqueue(db, kind, payload)
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job_response(job)),
+        headers={"Location": f"/api/jobs/{job.id}"},
+    )
+
+
+async def cancel(db: AsyncSession, job: Job) -> Job:
+    """Cancel a queued job at once, or ask the worker running it to stop."""
+    now = datetime.utcnow()
+    await db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "queued")
+        .values(status="cancelled", finished_at=now)
+    )
+    await db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running")
+        .values(cancel_requested=True)
+    )
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+class JobQueue:
+    """Worker tasks that run queued jobs in this process."""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def notify(self) -> None:
+        """Wake the idle workers of this process (others find the job when they poll)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work(f"{self.worker_id}-{index}")))
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running are picked up again when their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, worker_id: str) -> None:
+        while True:
+            try:
+                job = await self._claim(worker_id)
+                if job is not None:
+                    await self._run(job, worker_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running background job: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return or_(
+            and_(Job.status == "queued", Job.available_at <= now),
+            and_(Job.status == "running", Job.lease_expires_at < now),
+        )
+
+    async def _claim(self, worker_id: str) -> Optional[Job]:
+        """Take the oldest claimable job, if any."""
+        async with AsyncSessionLocal() as db:
+            now = datetime.utcnow()
+            candidates = (await db.scalars(
+                select(Job.id).where(self._claimable(now)).order_by(Job.available_at).limit(5)
+            )).all()
+            for job_id in candidates:
+                # Only one worker's update can match; the others move on to the next candidate
+                claimed = await db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, self._claimable(now))
+                    .values(
+                        status="running",
+                        worker_id=worker_id,
+                        attempts=Job.attempts + 1,
+                        started_at=now,
+                        lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    )
+                )
+                await db.commit()
+                if claimed.rowcount == 1:
+                    return await db.get(Job, job_id, populate_existing=True)
+        return None
+
+    async def _run(self, job: Job, worker_id: str) -> None:
+        async with AsyncSessionLocal() as db:
+            handler = JOB_HANDLERS.get(job.kind)
+            if handler is None:
+                await self._finish(db, job, worker_id, status="failed", error=f"Unknown job kind: {job.kind}", status_code=500)
+                return
+            if job.attempts > JOB_MAX_ATTEMPTS:
+                # Claimed again after its lease expired too many times
+                await self._finish(db, job, worker_id, status="failed", error="The job's worker stopped responding", status_code=500)
+                return
+
+            task = asyncio.create_task(handler(job.get_payload(), db))
+            stop_reason = {}
+            heartbeat = asyncio.create_task(self._heartbeat(job.id, worker_id, task, stop_reason))
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if not stop_reason:
+                    # The worker itself is shutting down; the handler stops with it
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+                await db.rollback()
+                if stop_reason.get("reason") == "cancelled":
+                    await self._finish(db, job, worker_id, status="cancelled")
+                return
+            except Exception as e:
+                await db.rollback()
+                if isinstance(e, HTTPException):
+                    error, status_code = str(e.detail), e.status_code
+                else:
+                    error, status_code = str(e), 500
+                # Rate limits and upstream failures are worth retrying; bad requests are not
+                if (status_code == 429 or status_code >= 500) and job.attempts < JOB_MAX_ATTEMPTS:
+                    await self._retry(db, job, worker_id, error)
+                else:
+                    await self._finish(db, job, worker_id, status="failed", error=error, status_code=status_code)
+                return
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+            await self._finish(db, job, worker_id, status="succeeded", error=None, result=json.dumps(jsonable_encoder(result)))
+
+    async def _heartbeat(self, job_id: str, worker_id: str, task: asyncio.Task, stop_reason: dict) -> None:
+        """Renew the job's lease while it runs and stop it if the client cancels it."""
+        renewed = time.monotonic()
+        while not task.done():
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            async with AsyncSessionLocal() as db:
+                cancel_requested = await db.scalar(
+                    select(Job.cancel_requested).where(Job.id == job_id, Job.worker_id == worker_id, Job.status == "running")
+                )
+                if cancel_requested is None:
+                    stop_reason["reason"] = "lost"  # Another worker took the job over
+                elif cancel_requested:
+                    stop_reason["reason"] = "cancelled"
+                elif time.monotonic() - renewed > JOB_LEASE_SECONDS / 3:
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.worker_id == worker_id)
+                        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+                    )
+                    await db.commit()
+                    renewed = time.monotonic()
+            if stop_reason:
+                task.cancel()
+                return
+
+    async def _retry(self, db: AsyncSession, job: Job, worker_id: str, error: str) -> None:
+        delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        await db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.worker_id == worker_id, Job.status == "running")
+            .values(
+                status="queued",
+                error=error,
+                worker_id=None,
+                lease_expires_at=None,
+                available_at=datetime.utcnow() + timedelta(seconds=delay),
+            )
+        )
+        await db.commit()
+
+    async def _finish(self, db: AsyncSession, job: Job, worker_id: str, status: str, **values) -> None:
+        """Record the outcome, and commit the handler's writes with it, unless the job was taken over."""
+        finished = await db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.worker_id == worker_id, Job.status == "running")
+            .values(status=status, finished_at=datetime.utcnow(), lease_expires_at=None, **values)
+        )
+        if finished.rowcount == 1:
+            await db.commit()
+        else:
+            await db.rollback()
+
+
+# Workers of this process, started with the application
+job_queue = JobQueue()
@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+from datetime import datetime
+
+class JobResponse(BaseModel):
+    """Response model for a background job."""
+    id: str
+    kind: str
+    status: str  # queued, running, succeeded, failed or cancelled
+    attempts: int
+    error: Optional[str] = None  # Error of the last attempt
+    status_code: Optional[int] = None  # HTTP status of a failed job's error
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Any] = None  # Response the endpoint would have returned, once the job succeeded
@@ -1,46 +1,340 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import Response
-from typing import List, Dict, Optional
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from typing import AsyncIterator, List, Dict, Optional
+import asyncio
+import base64
+import binascii
+import hashlib
 import io
+import json
 import os
 import time
 from datetime import datetime
-from sqlalchemy.orm import Session
-from ..groq_client import GroqClient
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, load_only
+from ..groq_client import GroqClient, get_groq_client
 from .models import LLMInteraction
-from .schemas import LLMPromptRequest, LLMPromptResponse, LLMHistoryResponse, LLMImageResponse
-from ..input_api.models import SessionLocal
+from .schemas import (
+    LLMPromptRequest,
+    LLMPromptResponse,
+    LLMHistoryResponse,
+    LLMImageResponse,
+    LLMCacheStatsResponse,
+    LLMBatchItem,
+    LLMBatchRequest,
+    LLMBatchResponse,
+    ConversationSessionCreate,
+    ConversationPromptRequest,
+    ConversationMessageResponse,
+    ConversationSessionResponse,
+    ConversationReplyResponse,
+)
+from ..input_api.models import CSVData
+from ..database import AsyncSessionLocal, get_async_db
+from ..storage import image_store
+from ..llm_cache import response_cache
+from ..conversation_store import conversation_store
+from ..jobs_api.queue import enqueue_response, job_handler
+from ..settings import LLM_BATCH_MAX_CONCURRENCY, LLM_BATCH_MAX_ITEMS, LLM_BATCH_CSV_MAX_BYTES
 
 router = APIRouter()
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
+# Stored images never change, so clients may cache them and revalidate by ETag
+IMAGE_CACHE_CONTROL = "public, max-age=86400"
+
+def image_media_type(filename: Optional[str]) -> str:
+    """Determine the content type of an image based on its filename extension."""
+    content_type = "image/jpeg"  # Default
+    if filename:
+        if filename.endswith(".png"):
+            content_type = "image/png"
+        elif filename.endswith(".gif"):
+            content_type = "image/gif"
+        elif filename.endswith(".webp"):
+            content_type = "image/webp"
+    return content_type
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_interaction(tokens: AsyncIterator[str], **interaction_fields) -> AsyncIterator[str]:
+    """Forward tokens as SSE "token" events, then store the interaction and send it as a "done" event."""
+    start_time = time.time()
+    parts = []
     try:
-        yield db
-    finally:
-        db.close()
+        async for token in tokens:
+            parts.append(token)
+            yield sse_event("token", {"token": token})
+    except Exception as e:
+        print(f"Error streaming prompt with Groq API: {str(e)}")
+        yield sse_event("error", {"detail": str(e)})
+        return
+
+    # The request's session is already closed while the body streams, so use a new one
+    async with AsyncSessionLocal() as db:
+        llm_interaction = LLMInteraction(
+            response="".join(parts),
+            processing_time=int((time.time() - start_time) * 1000),
+            timestamp=datetime.utcnow(),
+            **interaction_fields
+        )
+        db.add(llm_interaction)
+        await db.commit()
+        await db.refresh(llm_interaction)
+        payload = jsonable_encoder(LLMPromptResponse.model_validate(llm_interaction, from_attributes=True))
+
+    yield sse_event("done", payload)
+
+def event_stream_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap SSE events in a response that proxies won't buffer."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def answer_text_prompt(prompt: str, model_name: Optional[str], db: AsyncSession, groq_client: GroqClient) -> LLMInteraction:
+    """Send a text prompt and record the interaction (flushed, the caller commits)."""
+    # Process the prompt
+    result = await groq_client.process_text_prompt(
+        prompt=prompt,
+        model_name=model_name
+    )
+    
+    # Failed calls are reported to the client instead of being stored as answers
+    if result.get("error"):
+        raise HTTPException(status_code=result["status_code"], detail=f"Error processing text prompt: {result['error']}")
+    
+    # Create a database record
+    llm_interaction = LLMInteraction(
+        prompt=prompt,
+        response=result["response"],
+        prompt_type="text_only",
+        model_used=result["model_used"],
+        processing_time=result["processing_time"],
+        timestamp=datetime.utcnow()
+    )
+    
+    # Add to database
+    db.add(llm_interaction)
+    await db.flush()
+    
+    return llm_interaction
+
+@job_handler("prompt_text")
+async def text_prompt_job(payload: dict, db: AsyncSession) -> LLMPromptResponse:
+    """Run a text prompt queued with background=true."""
+    interaction = await answer_text_prompt(payload["prompt"], payload["model_name"], db, get_groq_client())
+    return LLMPromptResponse.model_validate(interaction, from_attributes=True)
 
 @router.post("/prompt/text", response_model=LLMPromptResponse)
 async def process_text_prompt(
     prompt_request: LLMPromptRequest,
-    db: Session = Depends(get_db)
+    background: bool = Query(False, description="Return 202 with a job id at once and run the prompt in the background"),
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
 ):
     """Process a text-only prompt."""
-    # Initialize the Groq client
-    groq_client = GroqClient(model_name=prompt_request.model_name)
+    if background:
+        return await enqueue_response(db, "prompt_text", prompt_request.model_dump())
     
-    # Process the prompt
-    result = await groq_client.process_text_prompt(
+    llm_interaction = await answer_text_prompt(prompt_request.prompt, prompt_request.model_name, db, groq_client)
+    await db.commit()
+    await db.refresh(llm_interaction)
+    
+    return llm_interaction
+
+@router.post("/prompt/text/stream")
+async def stream_text_prompt(
+    prompt_request: LLMPromptRequest,
+    groq_client: GroqClient = Depends(get_groq_client)
+):
+    """Process a text-only prompt, streaming the response as Server-Sent Events."""
+    model = prompt_request.model_name or groq_client.model_name
+    tokens = groq_client.stream_text_prompt(prompt=prompt_request.prompt, model_name=model)
+    return event_stream_response(stream_interaction(
+        tokens,
         prompt=prompt_request.prompt,
-        model_name=prompt_request.model_name
+        prompt_type="text_only",
+        model_used=model
+    ))
+
+async def build_batch_prompt(item: LLMBatchItem, db: AsyncSession) -> str:
+    """Return the prompt of a batch item, with the referenced CSV appended."""
+    if item.csv_id is None:
+        return item.prompt
+
+    csv_data = await db.get(CSVData, item.csv_id)
+    if not csv_data:
+        raise ValueError(f"CSV data {item.csv_id} not found")
+
+    def read_content() -> bytes:
+        with csv_data.open_content() as content_file:
+            return content_file.read(LLM_BATCH_CSV_MAX_BYTES + 1)
+
+    # File reads would block the event loop that the other batch items share
+    content = await run_in_threadpool(read_content)
+    truncated = len(content) > LLM_BATCH_CSV_MAX_BYTES
+    content = content[:LLM_BATCH_CSV_MAX_BYTES].decode("utf-8", errors="ignore")
+    note = " (truncated)" if truncated else ""
+    return f"{item.prompt}\n\nCSV data from {csv_data.filename}{note}:\n{content}"
+
+async def run_batch(
+    batch_request: LLMBatchRequest,
+    db: AsyncSession,
+    groq_client: GroqClient,
+    images: Optional[Dict[int, bytes]] = None
+) -> dict:
+    """Process a batch and record its interactions (flushed, the caller commits).
+
+    images holds the images of items whose image_base64 was already decoded, by item index.
+    """
+    images = images or {}
+    model = batch_request.model_name or groq_client.model_name
+    concurrency = max(1, min(batch_request.max_concurrency or LLM_BATCH_MAX_CONCURRENCY, LLM_BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Resolve CSV content and decode images up front, before any model call
+    prepared = []
+    for index, item in enumerate(batch_request.items):
+        try:
+            prompt = await build_batch_prompt(item, db)
+            image_data = images.get(index)
+            if image_data is None and item.image_base64:
+                image_data = base64.b64decode(item.image_base64, validate=True)
+            prepared.append((item, prompt, image_data, None))
+        except binascii.Error as e:
+            prepared.append((item, None, None, f"Invalid image_base64: {str(e)}"))
+        except ValueError as e:
+            prepared.append((item, None, None, str(e)))
+        except OSError as e:
+            # The CSV's content file is missing or unreadable
+            prepared.append((item, None, None, f"Could not read CSV data {item.csv_id}: {str(e)}"))
+
+    async def run_item(prompt: str, image_data: Optional[bytes]) -> dict:
+        # GroqClient applies the shared rate limiter and retries to every call
+        async with semaphore:
+            if image_data is not None:
+                return await groq_client.process_multimodal_prompt(
+                    text_prompt=prompt,
+                    image_bytes=image_data,
+                    model_name=model
+                )
+            return await groq_client.process_text_prompt(prompt=prompt, model_name=model)
+
+    async def skip(error: str) -> dict:
+        return {"error": error}
+
+    results = await asyncio.gather(*[
+        skip(error) if error else run_item(prompt, image_data)
+        for _, prompt, image_data, error in prepared
+    ])
+
+    # Insert every successful interaction in one transaction
+    interactions = {}
+    timestamp = datetime.utcnow()
+    for index, ((item, _, image_data, _), result) in enumerate(zip(prepared, results)):
+        if result.get("error"):
+            continue
+        interactions[index] = LLMInteraction(
+            prompt=item.prompt,
+            response=result["response"],
+            prompt_type="text_and_image" if image_data is not None else "text_only",
+            image_hash=image_store.put_bytes(image_data) if image_data is not None else None,
+            model_used=result["model_used"],
+            processing_time=result["processing_time"],
+            timestamp=timestamp
+        )
+    db.add_all(interactions.values())
+    await db.flush()
+    responses = {
+        index: LLMPromptResponse.model_validate(interaction, from_attributes=True)
+        for index, interaction in interactions.items()
+    }
+
+    return {
+        "results": [
+            {"index": index, "interaction": responses.get(index), "error": result.get("error")}
+            for index, result in enumerate(results)
+        ]
+    }
+
+@job_handler("prompt_batch")
+async def batch_prompt_job(payload: dict, db: AsyncSession) -> dict:
+    """Run a batch queued with background=true."""
+    payload = dict(payload)
+    images = {}
+    for index, image_hash in payload.pop("image_hashes", {}).items():
+        with image_store.open(image_hash) as image_file:
+            images[int(index)] = image_file.read()
+    return await run_batch(LLMBatchRequest.model_validate(payload), db, get_groq_client(), images)
+
+@router.post("/prompt/batch", response_model=LLMBatchResponse)
+async def process_batch_prompt(
+    batch_request: LLMBatchRequest,
+    background: bool = Query(False, description="Return 202 with a job id at once and run the batch in the background"),
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
+):
+    """Process a list of prompts concurrently.
+
+    Items are sent to the model under a concurrency limit and the shared rate
+    limiter; results come back in request order, with per-item errors.
+    """
+    if len(batch_request.items) > LLM_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {LLM_BATCH_MAX_ITEMS} items")
+
+    if background:
+        # Keep images out of the job payload: queued jobs read them back from the image store
+        payload = batch_request.model_dump()
+        payload["image_hashes"] = {}
+        for index, item in enumerate(payload["items"]):
+            if not item["image_base64"]:
+                continue
+            try:
+                image_data = base64.b64decode(item["image_base64"], validate=True)
+            except binascii.Error:
+                continue  # Left in place, so the job reports it as that item's error
+            payload["image_hashes"][str(index)] = image_store.put_bytes(image_data)
+            item["image_base64"] = None
+        return await enqueue_response(db, "prompt_batch", payload)
+
+    results = await run_batch(batch_request, db, groq_client)
+    await db.commit()
+    return results
+
+async def answer_image_prompt(
+    prompt: str,
+    image_data: bytes,
+    image_filename: Optional[str],
+    model_name: Optional[str],
+    prompt_type: str,
+    db: AsyncSession,
+    groq_client: GroqClient
+) -> LLMInteraction:
+    """Send a prompt with an image and record the interaction (flushed, the caller commits)."""
+    # Process the multimodal prompt
+    result = await groq_client.process_multimodal_prompt(
+        text_prompt=prompt,
+        image_bytes=image_data,
+        model_name=model_name
     )
     
-    # Create a database record
+    # Failed calls are reported to the client instead of being stored as answers
+    if result.get("error"):
+        raise HTTPException(status_code=result["status_code"], detail=result["error"])
+    
+    # Create a database record with the image data
     llm_interaction = LLMInteraction(
-        prompt=prompt_request.prompt,
+        prompt=prompt,
         response=result["response"],
-        prompt_type="text_only",
+        prompt_type=prompt_type,
+        image_hash=image_store.put_bytes(image_data),
+        image_filename=image_filename,
         model_used=result["model_used"],
         processing_time=result["processing_time"],
         timestamp=datetime.utcnow()
@@ -48,8 +342,50 @@ async def process_text_prompt(
     
     # Add to database
     db.add(llm_interaction)
-    db.commit()
-    db.refresh(llm_interaction)
+    await db.flush()
+    
+    return llm_interaction
+
+@job_handler("prompt_image")
+async def image_prompt_job(payload: dict, db: AsyncSession) -> LLMPromptResponse:
+    """Run an image prompt queued with background=true."""
+    with image_store.open(payload["image_hash"]) as image_file:
+        image_data = image_file.read()
+    interaction = await answer_image_prompt(
+        payload["prompt"],
+        image_data,
+        payload["image_filename"],
+        payload["model_name"],
+        payload["prompt_type"],
+        db,
+        get_groq_client()
+    )
+    return LLMPromptResponse.model_validate(interaction, from_attributes=True)
+
+async def respond_to_image_prompt(
+    prompt: str,
+    image: UploadFile,
+    model_name: Optional[str],
+    prompt_type: str,
+    background: bool,
+    db: AsyncSession,
+    groq_client: GroqClient
+):
+    """Answer an image prompt now, or queue it when background is set."""
+    image_data = await image.read()
+    if background:
+        # Queued jobs read the image back from the image store
+        return await enqueue_response(db, "prompt_image", {
+            "prompt": prompt,
+            "image_hash": image_store.put_bytes(image_data),
+            "image_filename": image.filename,
+            "model_name": model_name,
+            "prompt_type": prompt_type
+        })
+    
+    llm_interaction = await answer_image_prompt(prompt, image_data, image.filename, model_name, prompt_type, db, groq_client)
+    await db.commit()
+    await db.refresh(llm_interaction)
     
     return llm_interaction
 
@@ -58,109 +394,115 @@ async def process_image_prompt(
     prompt: str = Form(...),
     image: UploadFile = File(...),
     model_name: Optional[str] = Form("llama-3.2-90b-vision-preview"),
-    db: Session = Depends(get_db)
+    background: bool = Query(False, description="Return 202 with a job id at once and run the prompt in the background"),
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
 ):
     """Process a prompt with an image."""
     try:
-        # Read image data
-        start_time = time.time()
-        image_data = await image.read()
-        
-        # Initialize the Groq client
-        groq_client = GroqClient(model_name=model_name)
-        
-        # Process the multimodal prompt
-        result = await groq_client.process_multimodal_prompt(
-            text_prompt=prompt,
-            image_bytes=image_data,
-            model_name=model_name
-        )
-        
-        # Create a database record with the image data
-        llm_interaction = LLMInteraction(
-            prompt=prompt,
-            response=result["response"],
-            prompt_type="text_and_image",
-            image_data=image_data,
-            image_filename=image.filename,
-            model_used=result["model_used"],
-            processing_time=result["processing_time"],
-            timestamp=datetime.utcnow()
-        )
-        
-        # Add to database
-        db.add(llm_interaction)
-        db.commit()
-        db.refresh(llm_interaction)
-        
-        return llm_interaction
-    
+        return await respond_to_image_prompt(prompt, image, model_name, "text_and_image", background, db, groq_client)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image prompt: {str(e)}")
 
+@router.post("/prompt/image/stream")
+async def stream_image_prompt(
+    prompt: str = Form(...),
+    image: UploadFile = File(...),
+    model_name: Optional[str] = Form("llama-3.2-90b-vision-preview"),
+    groq_client: GroqClient = Depends(get_groq_client)
+):
+    """Process a prompt with an image, streaming the response as Server-Sent Events."""
+    image_data = await image.read()
+    model = model_name or groq_client.model_name
+    if "vision" not in model:
+        raise HTTPException(status_code=400, detail="The specified model does not support vision capabilities")
+
+    tokens = groq_client.stream_multimodal_prompt(text_prompt=prompt, image_bytes=image_data, model_name=model)
+    return event_stream_response(stream_interaction(
+        tokens,
+        prompt=prompt,
+        prompt_type="text_and_image",
+        image_hash=image_store.put_bytes(image_data),
+        image_filename=image.filename,
+        model_used=model
+    ))
+
 @router.post("/prompt/image-only", response_model=LLMPromptResponse)
 async def process_image_only(
     image: UploadFile = File(...),
     model_name: Optional[str] = Form("llama-3.2-90b-vision-preview"),
-    db: Session = Depends(get_db)
+    background: bool = Query(False, description="Return 202 with a job id at once and run the prompt in the background"),
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
 ):
     """Process an image without a text prompt."""
     try:
-        # Read image data
-        image_data = await image.read()
-        
         # Default prompt for image-only requests
         default_prompt = "What can you see in this image? Provide a detailed description."
         
-        # Initialize the Groq client
-        groq_client = GroqClient(model_name=model_name)
-        
-        # Process the multimodal prompt using the default prompt
-        result = await groq_client.process_multimodal_prompt(
-            text_prompt=default_prompt,
-            image_bytes=image_data,
-            model_name=model_name
-        )
-        
-        # Create a database record with the image data
-        llm_interaction = LLMInteraction(
-            prompt=default_prompt,
-            response=result["response"],
-            prompt_type="image_only",
-            image_data=image_data,
-            image_filename=image.filename,
-            model_used=result["model_used"],
-            processing_time=result["processing_time"],
-            timestamp=datetime.utcnow()
-        )
-        
-        # Add to database
-        db.add(llm_interaction)
-        db.commit()
-        db.refresh(llm_interaction)
-        
-        return llm_interaction
-    
+        return await respond_to_image_prompt(default_prompt, image, model_name, "image_only", background, db, groq_client)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 @router.get("/history", response_model=List[LLMHistoryResponse])
-async def get_interaction_history(db: Session = Depends(get_db)):
-    """Get the history of LLM interactions."""
+async def get_interaction_history(
+    response: Response,
+    after_id: Optional[int] = Query(None, description="Return interactions older than this one"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the history of LLM interactions, most recent first.
+
+    Pages are keyed on (timestamp, id); pass the X-Next-Cursor header of a
+    response as after_id to get the next page.
+    """
     try:
-        # Query the database for all interactions, most recent first
-        interactions = db.query(LLMInteraction).order_by(LLMInteraction.timestamp.desc()).all()
+        # Skip the image blobs and other columns the history view doesn't need
+        query = select(LLMInteraction).options(load_only(
+            LLMInteraction.id,
+            LLMInteraction.prompt,
+            LLMInteraction.response,
+            LLMInteraction.prompt_type,
+            LLMInteraction.timestamp,
+            LLMInteraction.image_filename
+        ))
+
+        if after_id is not None:
+            cursor = await db.scalar(select(LLMInteraction.timestamp).where(LLMInteraction.id == after_id))
+            if not cursor:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.where(or_(
+                LLMInteraction.timestamp < cursor,
+                and_(LLMInteraction.timestamp == cursor, LLMInteraction.id < after_id)
+            ))
+
+        interactions = (await db.scalars(query.order_by(
+            LLMInteraction.timestamp.desc(),
+            LLMInteraction.id.desc()
+        ).limit(limit))).all()
+
+        if len(interactions) == limit:
+            response.headers["X-Next-Cursor"] = str(interactions[-1].id)
+
         return interactions
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving history: {str(e)}")
 
 @router.get("/history/{interaction_id}", response_model=LLMPromptResponse)
-async def get_interaction_detail(interaction_id: int, db: Session = Depends(get_db)):
+async def get_interaction_detail(interaction_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get details of a specific LLM interaction."""
     try:
         # Query the database for the specific interaction
-        interaction = db.query(LLMInteraction).filter(LLMInteraction.id == interaction_id).first()
+        interaction = await db.scalar(select(LLMInteraction).options(defer(LLMInteraction.image_data)).where(
+            LLMInteraction.id == interaction_id
+        ))
         
         if not interaction:
             raise HTTPException(status_code=404, detail="Interaction not found")
@@ -173,29 +515,147 @@ async def get_interaction_detail(interaction_id: int, db: Session = Depends(get_
         raise HTTPException(status_code=500, detail=f"Error retrieving interaction: {str(e)}")
 
 @router.get("/history/{interaction_id}/image")
-async def get_interaction_image(interaction_id: int, db: Session = Depends(get_db)):
-    """Get the image associated with a specific LLM interaction."""
+async def get_interaction_image(interaction_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get the image associated with a specific LLM interaction.
+
+    Images are served with an ETag (their SHA-256) so clients can revalidate
+    with If-None-Match and get a 304 instead of the image.
+    """
     try:
-        # Query the database for the specific interaction
-        interaction = db.query(LLMInteraction).filter(LLMInteraction.id == interaction_id).first()
+        # Query the database for the specific interaction, without the legacy blob column
+        interaction = await db.scalar(select(LLMInteraction).options(defer(LLMInteraction.image_data)).where(
+            LLMInteraction.id == interaction_id
+        ))
         
         if not interaction:
             raise HTTPException(status_code=404, detail="Interaction not found")
-            
-        if not interaction.image_data:
+
+        image_hash = interaction.image_hash
+        legacy_data = None
+        if not image_hash:
+            # Rows created before the image store kept the bytes in the database
+            # Load the deferred column explicitly, async sessions can't lazy-load it
+            legacy_data = await db.scalar(select(LLMInteraction.image_data).where(LLMInteraction.id == interaction_id))
+            if legacy_data:
+                image_hash = hashlib.sha256(legacy_data).hexdigest()
+
+        if not image_hash:
             raise HTTPException(status_code=404, detail="No image associated with this interaction")
-            
-        # Determine content type based on filename extension
-        content_type = "image/jpeg"  # Default
-        if interaction.image_filename:
-            if interaction.image_filename.endswith(".png"):
-                content_type = "image/png"
-            elif interaction.image_filename.endswith(".gif"):
-                content_type = "image/gif"
-            elif interaction.image_filename.endswith(".webp"):
-                content_type = "image/webp"
-        
-        # Return the image data directly
-        return Response(content=interaction.image_data, media_type=content_type)
+
+        etag = f'"{image_hash}"'
+        headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        content_type = image_media_type(interaction.image_filename)
+        if legacy_data is not None:
+            return Response(content=legacy_data, media_type=content_type, headers=headers)
+
+        # FileResponse streams the file (using sendfile where the server supports it)
+        return FileResponse(image_store.path_for(image_hash), media_type=content_type, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving image: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error retrieving image: {str(e)}")
+
+
+@router.get("/cache/stats", response_model=LLMCacheStatsResponse)
+async def get_cache_stats():
+    """Get hit/miss counters and usage of the LLM response cache."""
+    return response_cache.stats()
+
+@router.delete("/cache", response_model=LLMCacheStatsResponse)
+async def clear_cache():
+    """Drop every cached LLM response."""
+    await response_cache.clear()
+    return response_cache.stats()
+
+
+def session_response(session, messages=()) -> ConversationSessionResponse:
+    """Serialize a conversation session with the given messages."""
+    return ConversationSessionResponse.model_validate({
+        **{column.name: getattr(session, column.name) for column in session.__table__.columns},
+        "messages": [ConversationMessageResponse.model_validate(message, from_attributes=True) for message in messages],
+    })
+
+async def get_session_or_404(session_id: str, db: AsyncSession):
+    session = await conversation_store.get(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.post("/sessions", response_model=ConversationSessionResponse, status_code=201)
+async def create_session(
+    session_request: ConversationSessionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
+):
+    """Start a conversation session."""
+    session = await conversation_store.create(db, session_request.model_name or groq_client.model_name)
+    await db.commit()
+    await db.refresh(session)
+    return session_response(session)
+
+@router.get("/sessions/{session_id}", response_model=ConversationSessionResponse)
+async def get_session(
+    session_id: str,
+    include_summarized: bool = Query(False, description="Also return messages already folded into the summary"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a conversation session: its summary, recent messages and token counts."""
+    session = await get_session_or_404(session_id, db)
+    messages = await conversation_store.messages(db, session, include_summarized=include_summarized)
+    return session_response(session, messages)
+
+@router.post("/sessions/{session_id}/messages", response_model=ConversationReplyResponse)
+async def send_session_message(
+    session_id: str,
+    prompt_request: ConversationPromptRequest,
+    db: AsyncSession = Depends(get_async_db),
+    groq_client: GroqClient = Depends(get_groq_client)
+):
+    """Send a prompt within a conversation session.
+
+    The model gets the session's summary and as many recent messages as fit
+    the token budget. Once the session is over budget, older messages are
+    summarized after the reply.
+    """
+    session = await get_session_or_404(session_id, db)
+    window = await conversation_store.messages(db, session)
+    result = await groq_client.process_chat(
+        conversation_store.context(session, window, prompt_request.prompt),
+        model_name=session.model_name
+    )
+    conversation_store.record_usage(session, result)
+
+    # Failed calls are reported to the client instead of being stored as answers
+    if result.get("error"):
+        await db.commit()
+        raise HTTPException(status_code=result["status_code"], detail=f"Error processing prompt: {result['error']}")
+
+    conversation_store.add_message(db, session, "user", prompt_request.prompt)
+    reply = conversation_store.add_message(db, session, "assistant", result["response"])
+    await db.flush()
+
+    async def summarize(summary, messages):
+        return await groq_client.summarize_conversation(summary, messages, model_name=session.model_name)
+
+    summarized = await conversation_store.compact(db, session, summarize)
+    await db.commit()
+    await db.refresh(session)
+    await db.refresh(reply)
+
+    return {
+        "reply": ConversationMessageResponse.model_validate(reply, from_attributes=True),
+        "session": session_response(session),
+        "processing_time": result["processing_time"],
+        "summarized": summarized
+    }
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Delete a conversation session and its messages."""
+    session = await get_session_or_404(session_id, db)
+    await conversation_store.delete(db, session)
+    await db.commit()
+    return Response(status_code=204)
@@ -1,9 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, Index, Boolean, ForeignKey
 from datetime import datetime
-from ..input_api.models import Base, engine, SessionLocal
+from ..database import Base
 
 class LLMInteraction(Base):
     """Model to store LLM prompts and responses."""
@@ -13,7 +10,8 @@ class LLMInteraction(Base):
     prompt = Column(Text, nullable=False)  # The text prompt sent to the LLM
     response = Column(Text, nullable=False)  # The response from the LLM
     prompt_type = Column(String, nullable=False)  # 'text_only', 'image_only', or 'text_and_image'
-    image_data = Column(LargeBinary, nullable=True)  # Image data stored directly in the database
+    image_data = Column(LargeBinary, nullable=True)  # Legacy rows only; new images live in the image store
+    image_hash = Column(String(64), index=True, nullable=True)  # SHA-256 of the image in image_store
     image_filename = Column(String, nullable=True)  # Original filename of the image if provided
     timestamp = Column(DateTime, default=datetime.utcnow)
     
@@ -21,7 +19,47 @@ class LLMInteraction(Base):
     model_used = Column(String, nullable=True)  # The model name/version used
     processing_time = Column(Integer, nullable=True)  # Time taken to process in milliseconds
 
-# Initialize database tables
-def init_llm_db():
-    """Create the LLM interaction table in the database."""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    __table_args__ = (
+        # Serves the history listing, which pages by (timestamp, id) newest first
+        Index("ix_llm_interactions_timestamp_id", "timestamp", "id"),
+    )
+
+class LLMCacheEntry(Base):
+    """Model to persist cached LLM responses across restarts and workers."""
+    __tablename__ = 'llm_cache_entries'
+
+    key = Column(String(64), primary_key=True)  # SHA-256 of model, prompt, image digest and parameters
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ConversationSession(Base):
+    """Model for a multi-turn conversation with the LLM."""
+    __tablename__ = 'conversation_sessions'
+
+    id = Column(String(32), primary_key=True)  # Random hex id handed to the client
+    model_name = Column(String, nullable=False)
+    summary = Column(Text, nullable=True)  # Summary of the messages that left the window
+    summary_tokens = Column(Integer, default=0, nullable=False)
+    window_tokens = Column(Integer, default=0, nullable=False)  # Estimated tokens of the unsummarized messages
+    prompt_tokens = Column(Integer, default=0, nullable=False)  # Tokens billed for the session, summaries included
+    completion_tokens = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ConversationMessage(Base):
+    """Model for one message of a conversation session."""
+    __tablename__ = 'conversation_messages'
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(32), ForeignKey('conversation_sessions.id', ondelete='CASCADE'), nullable=False)
+    role = Column(String, nullable=False)  # 'user' or 'assistant'
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False)  # Estimated tokens of the message
+    summarized = Column(Boolean, default=False, nullable=False)  # Folded into the session summary
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Serves loading a session's messages in order
+        Index("ix_conversation_messages_session_id_id", "session_id", "id"),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class LLMPromptRequest(BaseModel):
@@ -36,4 +36,79 @@ class LLMHistoryResponse(BaseModel):
 class LLMImageResponse(BaseModel):
     """Response model for retrieving an image from an LLM interaction."""
     image_data: bytes
-    image_filename: str 
\ No newline at end of file
+    image_filename: str 
+
+class LLMCacheStatsResponse(BaseModel):
+    """Response model for the LLM response cache statistics."""
+    enabled: bool
+    persist: bool
+    entries: int
+    size_bytes: int
+    max_entries: int
+    max_bytes: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class LLMBatchItem(BaseModel):
+    """A single prompt of a batch request."""
+    prompt: str
+    csv_id: Optional[int] = None  # Stored CSV whose content is appended to the prompt
+    image_base64: Optional[str] = None  # Image sent along with the prompt
+
+class LLMBatchRequest(BaseModel):
+    """Request model for the batch prompt API."""
+    items: List[LLMBatchItem]
+    model_name: Optional[str] = "llama-3.2-90b-vision-preview"
+    max_concurrency: Optional[int] = None  # Defaults to LLM_BATCH_MAX_CONCURRENCY
+
+class LLMBatchItemResult(BaseModel):
+    """Result of one item of a batch request; exactly one of interaction and error is set."""
+    index: int
+    interaction: Optional[LLMPromptResponse] = None
+    error: Optional[str] = None
+
+class LLMBatchResponse(BaseModel):
+    """Response model for the batch prompt API, in the order of the request items."""
+    results: List[LLMBatchItemResult]
+
+
+class ConversationSessionCreate(BaseModel):
+    """Request model for starting a conversation session."""
+    model_name: Optional[str] = "llama-3.2-90b-vision-preview"
+
+class ConversationPromptRequest(BaseModel):
+    """Request model for a prompt sent within a conversation session."""
+    prompt: str
+
+class ConversationMessageResponse(BaseModel):
+    """Response model for one message of a conversation session."""
+    id: int
+    role: str
+    content: str
+    tokens: int
+    summarized: bool
+    created_at: datetime
+
+class ConversationSessionResponse(BaseModel):
+    """Response model for a conversation session and its token accounting."""
+    id: str
+    model_name: str
+    summary: Optional[str] = None
+    summary_tokens: int
+    window_tokens: int
+    prompt_tokens: int
+    completion_tokens: int
+    created_at: datetime
+    updated_at: datetime
+    messages: List[ConversationMessageResponse] = []
+
+class ConversationReplyResponse(BaseModel):
+    """Response model for the answer to a prompt within a conversation session."""
+    reply: ConversationMessageResponse
+    session: ConversationSessionResponse
+    processing_time: int
+    summarized: bool  # Older messages were folded into the summary after this turn
@@ -0,0 +1,184 @@
+"""
+Response cache for LLM calls.
+Responses are kept in an in-memory LRU with a TTL and entry/size limits, and
+can optionally be persisted in the database so they survive restarts and are
+shared between workers. Database reads and writes run in the thread pool, so
+they don't block the event loop.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .database import SessionLocal
+from .llm_api.models import LLMCacheEntry
+from .settings import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PERSIST,
+    LLM_CACHE_TTL,
+)
+
+
+class ResponseCache:
+    """LRU cache of LLM responses with a TTL and entry/size limits."""
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        ttl: float = LLM_CACHE_TTL,
+        persist: bool = LLM_CACHE_PERSIST,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist = persist
+        self.enabled = enabled
+        # key -> (expiry timestamp, response)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        prompt: str,
+        temperature: float,
+        image_bytes: Optional[bytes] = None,
+        **params: Any,
+    ) -> str:
+        """Build a cache key from everything that affects the model's answer."""
+        image_digest = hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else None
+        payload = json.dumps(
+            {
+                "model": model,
+                "prompt": prompt,
+                "temperature": temperature,
+                "image": image_digest,
+                "params": params,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss."""
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.time():
+            self._remove(key)
+            entry = None
+
+        if entry is None and self.persist:
+            entry = await run_in_threadpool(self._load_persisted, key)
+            if entry is not None:
+                self._store(key, entry[1], entry[0])
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, response: str) -> None:
+        """Cache a response."""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._store(key, response, expires_at)
+        if self.persist:
+            await run_in_threadpool(self._save_persisted, key, response, expires_at)
+
+    async def clear(self) -> None:
+        """Drop every cached response, including persisted ones."""
+        self._entries.clear()
+        self._size = 0
+        if self.persist:
+            await run_in_threadpool(self._clear_persisted)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current usage."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persist": self.persist,
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _store(self, key: str, response: str, expires_at: float) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (expires_at, response)
+        self._size += size
+        # Evict least recently used entries until both limits hold
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1].encode("utf-8"))
+
+    def _load_persisted(self, key: str) -> Optional[Tuple[float, str]]:
+        db = SessionLocal()
+        try:
+            row = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+            if row is None:
+                return None
+            if row.expires_at < datetime.utcnow():
+                db.delete(row)
+                db.commit()
+                return None
+            expires_at = time.time() + (row.expires_at - datetime.utcnow()).total_seconds()
+            return expires_at, row.response
+        finally:
+            db.close()
+
+    def _clear_persisted(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(LLMCacheEntry).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def _save_persisted(self, key: str, response: str, expires_at: float) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(LLMCacheEntry(
+                key=key,
+                response=response,
+                expires_at=datetime.utcnow() + timedelta(seconds=expires_at - time.time()),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+
+# Cache shared by every GroqClient in the process
+response_cache = ResponseCache()
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
 
 app = FastAPI()
@@ -15,12 +16,22 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Initialize databases on startup"""
-    # Initialize databases
-    from api.input_api.models import init_db
-    init_db()
-    
-    from api.llm_api.models import init_llm_db
-    init_llm_db()
+    # Apply pending migrations once, unless deployments run `alembic upgrade head` themselves
+    from api.settings import DB_MIGRATE_ON_STARTUP
+    if DB_MIGRATE_ON_STARTUP:
+        from api.database import init_db
+        await run_in_threadpool(init_db)
+    # Start the workers that run background jobs
+    from api.jobs_api.queue import job_queue
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background job workers and close the shared Groq client's connection pool"""
+    from api.jobs_api.queue import job_queue
+    await job_queue.stop()
+    from api.groq_client import close_groq_client
+    await close_groq_client()
 
 @app.get("/")
 async def root():
@@ -30,13 +41,6 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
-# Initialize databases
-from api.input_api.models import init_db
-init_db()
-
-from api.llm_api.models import init_llm_db
-init_llm_db()
-
 # Include routers
 from api.input_api.endpoints import router as input_api_router
 app.include_router(input_api_router, prefix="/api/input", tags=["input"])
@@ -44,6 +48,9 @@ app.include_router(input_api_router, prefix="/api/input", tags=["input"])
 from api.llm_api.endpoints import router as llm_api_router
 app.include_router(llm_api_router, prefix="/api/llm", tags=["llm"])
 
+from api.jobs_api.endpoints import router as jobs_api_router
+app.include_router(jobs_api_router, prefix="/api/jobs", tags=["jobs"])
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
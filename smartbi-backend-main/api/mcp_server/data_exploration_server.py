@@ -1,6 +1,8 @@
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
 import pandas as pd
 import numpy as np
+import atexit
 import io
 import sys
 import os
@@ -9,6 +11,11 @@ import logging
 from pathlib import Path
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
+from dataframe_registry import DataFrameRegistry, format_bytes, frame_memory
+from lazy_frame import LazyCSVFrame, scan_csv
+import dtype_optimizer
+from script_cache import ScriptCache
+from script_sandbox import ScriptExecutor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -43,35 +50,138 @@ def log_message(message, level='INFO'):
 log_message(f"Data exploration server starting up. Logs will be written to {log_file}")
 log_message("You can monitor logs in a separate terminal using: 'type server/logs/data_exploration.log' (Windows) or 'tail -f server/logs/data_exploration.log' (Unix)")
 
+# The backend package (api.*) lives two directories up; load_dataset reads its stored CSVs
+BACKEND_DIR = str(Path(__file__).resolve().parents[2])
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+# Loaded dataframes are kept in memory up to this budget; older ones are spilled to disk
+DATAFRAME_MEMORY_BUDGET = int(os.getenv("MCP_DATAFRAME_MEMORY_BUDGET", str(2 * 1024 ** 3)))
+DATAFRAME_SPILL_DIR = os.getenv("MCP_DATAFRAME_SPILL_DIR", "server/dataframes")
+
+# CSV files larger than this are read out of core unless load_csv is told otherwise
+OUT_OF_CORE_THRESHOLD = int(os.getenv("MCP_OUT_OF_CORE_THRESHOLD", str(DATAFRAME_MEMORY_BUDGET // 4)))
+
+# Whether loads optimize dtypes when the tool call doesn't say
+OPTIMIZE_DTYPES = os.getenv("MCP_OPTIMIZE_DTYPES", "false").lower() in ("1", "true", "yes")
+
+# get_dataframe_info profiles a random sample of frames with more rows than this (0: never sample)
+PROFILE_SAMPLE_ROWS = int(os.getenv("MCP_PROFILE_SAMPLE_ROWS", "1000000"))
+# Columns in the default correlation matrix; other columns can be requested explicitly
+PROFILE_CORRELATION_COLUMNS = int(os.getenv("MCP_PROFILE_CORRELATION_COLUMNS", "10"))
+PROFILE_CACHE_SIZE = 128
+
+# Profile sections keyed by (frame name, frame version, ...); a new version makes old entries unreachable
+profile_cache = OrderedDict()
+
+# Scripts run in a pool of worker processes with these limits
+SCRIPT_WORKERS = int(os.getenv("MCP_SCRIPT_WORKERS", str(min(os.cpu_count() or 1, 4))))
+SCRIPT_TIMEOUT = float(os.getenv("MCP_SCRIPT_TIMEOUT", "120"))  # Wall-clock seconds
+SCRIPT_CPU_SECONDS = int(os.getenv("MCP_SCRIPT_CPU_SECONDS", "120"))
+SCRIPT_MEMORY_LIMIT = int(os.getenv("MCP_SCRIPT_MEMORY_LIMIT", str(4 * 1024 ** 3)))  # Bytes per worker, 0: unlimited
+
+# Compiled scripts and memoized script outputs
+SCRIPT_CACHE_ENTRIES = int(os.getenv("MCP_SCRIPT_CACHE_ENTRIES", "256"))
+SCRIPT_CACHE_MAX_BYTES = int(os.getenv("MCP_SCRIPT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
 # Store loaded dataframes
-dataframes = {}
-df_counter = 1
+dataframes = DataFrameRegistry(DATAFRAME_MEMORY_BUDGET, DATAFRAME_SPILL_DIR)
+# Keep the frames that are still in memory for the next run of the server
+atexit.register(dataframes.persist)
+
+script_executor = ScriptExecutor(SCRIPT_WORKERS, SCRIPT_TIMEOUT, SCRIPT_CPU_SECONDS, SCRIPT_MEMORY_LIMIT)
+atexit.register(script_executor.close)
+
+script_cache = ScriptCache(SCRIPT_CACHE_ENTRIES, SCRIPT_CACHE_ENTRIES, SCRIPT_CACHE_MAX_BYTES)
 
 # Initialize FastMCP server
 mcp = FastMCP("data-exploration")
 
+def cached_profile(key, compute):
+    """Return a cached profile section, computing and caching it on a miss."""
+    if key in profile_cache:
+        profile_cache.move_to_end(key)
+        return profile_cache[key]
+    value = compute()
+    profile_cache[key] = value
+    while len(profile_cache) > PROFILE_CACHE_SIZE:
+        profile_cache.popitem(last=False)
+    return value
+
+def store_frame(df_name: str, df: pd.DataFrame, optimize: Optional[bool]) -> str:
+    """Register a loaded frame, optimizing its dtypes if asked, and describe its memory use."""
+    memory = frame_memory(df)
+    if not (OPTIMIZE_DTYPES if optimize is None else optimize):
+        dataframes.put(df_name, df)
+        return f"Memory: {format_bytes(memory)}"
+    
+    df = dtype_optimizer.optimize_dtypes(df)
+    optimized = frame_memory(df)
+    dataframes.put(df_name, df, original_memory=memory)
+    return f"Memory: {format_bytes(optimized)} with optimized dtypes (was {format_bytes(memory)})"
+
+def read_table(path: str) -> pd.DataFrame:
+    """Read a CSV file, or memory-map a Parquet copy written by the backend."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, memory_map=True)
+    return pd.read_csv(path)
+
+def lazy_load_message(csv_path: str, df_name: str, frame: LazyCSVFrame) -> str:
+    """Describe a CSV registered out of core and how scripts can use it."""
+    rows, cols = frame.shape
+    missing = {column: count for column, count in frame.summary["missing_values"].items() if count}
+    return f"Loaded {csv_path} out of core as '{df_name}' (the data stays on disk and is read in chunks).\n" + \
+           f"Shape: {rows} rows x {cols} columns\n" + \
+           f"Columns: {', '.join(map(str, frame.columns))}\n" + \
+           f"Missing values: {missing or 'none'}\n" + \
+           f"In run_script use {df_name}.chunks(), {df_name}.head(n), {df_name}.to_pandas(usecols=..., nrows=...)" + \
+           f" or {df_name}.sql('SELECT ... FROM frame')."
+
 @mcp.tool()
-async def load_csv(csv_path: str, df_name: Optional[str] = None) -> str:
-    """Loads a CSV file into a DataFrame.
+async def load_csv(
+    csv_path: str,
+    df_name: Optional[str] = None,
+    out_of_core: Optional[bool] = None,
+    optimize_dtypes: Optional[bool] = None
+) -> str:
+    """Loads a CSV file (or its Parquet copy) into a DataFrame.
     
     Args:
-        csv_path: Path to the CSV file
+        csv_path: Path to the CSV file, or to a .parquet file
         df_name: Optional name for the DataFrame (defaults to df_1, df_2, etc.)
+        out_of_core: Read the CSV in chunks and keep only a lazy handle in memory.
+            Defaults to doing so for local files larger than MCP_OUT_OF_CORE_THRESHOLD bytes;
+            URLs and other remote paths are read eagerly.
+        optimize_dtypes: Downcast numbers, parse dates and use categories/Arrow strings
+            for text to save memory. Defaults to MCP_OPTIMIZE_DTYPES.
     """
-    global df_counter
     try:
         # Generate a default dataframe name if not provided
         if not df_name:
-            df_name = f"df_{df_counter}"
-            df_counter += 1
+            df_name = dataframes.next_name()
+        
+        if out_of_core is None:
+            out_of_core = (
+                not csv_path.endswith(".parquet")
+                and os.path.isfile(csv_path)
+                and os.path.getsize(csv_path) > OUT_OF_CORE_THRESHOLD
+            )
+        
+        if out_of_core:
+            logger.info(f"Scanning CSV file out of core: {csv_path}")
+            frame = scan_csv(csv_path)
+            dataframes.put(df_name, frame)
+            logger.info(f"Registered {csv_path} out of core with {frame.shape[0]} rows and {frame.shape[1]} columns")
+            return lazy_load_message(csv_path, df_name, frame)
         
         logger.info(f"Loading CSV file: {csv_path}")
         
         # Load the CSV file
-        df = pd.read_csv(csv_path)
+        df = read_table(csv_path)
         
-        # Store the dataframe in memory
-        dataframes[df_name] = df
+        # Store the dataframe in the registry
+        memory_note = store_frame(df_name, df, optimize_dtypes)
+        df = dataframes.get(df_name)
         
         # Generate summary information
         summary = {
@@ -87,6 +197,7 @@ async def load_csv(csv_path: str, df_name: Optional[str] = None) -> str:
         return f"Successfully loaded {csv_path} as '{df_name}'.\n" + \
                f"Shape: {summary['shape'][0]} rows x {summary['shape'][1]} columns\n" + \
                f"Columns: {', '.join(summary['columns'])}\n" + \
+               f"{memory_note}\n" + \
                f"First 5 rows preview available in memory."
     
     except Exception as e:
@@ -94,104 +205,268 @@ async def load_csv(csv_path: str, df_name: Optional[str] = None) -> str:
         logger.error(error_msg)
         return error_msg
 
+def read_dataset(
+    csv_id: int,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+    nrows: Optional[int] = None
+):
+    """Read a CSV stored by the backend and return (DataFrame, filename, source).
+
+    The Parquet copy is used when the backend wrote one; otherwise the stored
+    file is streamed straight into pandas.
+    """
+    # Imported here so the server also runs without the backend's dependencies
+    from api.database import SessionLocal
+    from api.input_api.models import CSVData
+    from api.input_api.columnar import columnar_path
+
+    db = SessionLocal()
+    try:
+        csv_data = db.query(CSVData).filter(CSVData.id == csv_id).first()
+    finally:
+        db.close()
+    if not csv_data:
+        raise ValueError(f"CSV data {csv_id} not found")
+
+    parquet_path = columnar_path(csv_data.content_hash) if csv_data.content_hash else None
+    if csv_data.columnar_dtypes and os.path.exists(parquet_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Read only the requested columns, and stop after nrows rows
+        parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+        batches = []
+        remaining = nrows
+        for batch in parquet_file.iter_batches(columns=usecols):
+            if remaining is not None:
+                batch = batch.slice(0, remaining)
+                remaining -= batch.num_rows
+            batches.append(batch)
+            if remaining == 0:
+                break
+        table = pa.Table.from_batches(batches) if batches else parquet_file.schema_arrow.empty_table()
+        df = (table.select(usecols) if usecols else table).to_pandas()
+        if dtype:
+            df = df.astype(dtype)
+        return df, csv_data.filename, "parquet"
+
+    with csv_data.open_content() as content:
+        df = pd.read_csv(content, usecols=usecols, dtype=dtype, nrows=nrows)
+    # read_csv keeps the file's column order; match the Parquet path
+    return (df[usecols] if usecols else df), csv_data.filename, "csv"
+
 @mcp.tool()
-async def run_script(script: str) -> str:
-    """Executes a Python script with access to loaded dataframes.
+async def load_dataset(
+    csv_id: int,
+    df_name: Optional[str] = None,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+    nrows: Optional[int] = None,
+    optimize_dtypes: Optional[bool] = None
+) -> str:
+    """Loads a CSV stored by the backend (uploaded or extracted from an image) into a DataFrame.
     
     Args:
-        script: The Python script to execute
+        csv_id: ID of the stored CSV, as returned by the upload endpoints
+        df_name: Optional name for the DataFrame (defaults to df_1, df_2, etc.)
+        usecols: Optional list of columns to load; other columns are not read
+        dtype: Optional mapping of column name to dtype, e.g. {"year": "int32"}
+        nrows: Optional maximum number of rows to load
+        optimize_dtypes: Downcast numbers, parse dates and use categories/Arrow strings
+            for text to save memory. Defaults to MCP_OPTIMIZE_DTYPES.
     """
     try:
-        # Log script execution
-        log_message(f"Executing script: {script[:100]}{'...' if len(script) > 100 else ''}")
+        logger.info(f"Loading stored CSV {csv_id} (columns: {usecols or 'all'}, rows: {nrows or 'all'})")
         
-        # Create a StringIO object to capture output
-        output_buffer = io.StringIO()
-        old_stdout = sys.stdout
-        sys.stdout = output_buffer
+        df, filename, source = read_dataset(csv_id, usecols=usecols, dtype=dtype, nrows=nrows)
         
-        # Create a local environment with pandas, numpy and loaded dataframes
-        local_env = {
-            'pd': pd,
-            'np': np,
-            'plt': None,  # Will be imported in the script if needed
-        }
+        # Generate a default dataframe name if not provided
+        if not df_name:
+            df_name = dataframes.next_name()
         
-        # Add all loaded dataframes to the local environment
-        for df_name, df in dataframes.items():
-            local_env[df_name] = df
+        # Store the dataframe in the registry
+        memory_note = store_frame(df_name, df, optimize_dtypes)
         
-        # Execute the script
-        try:
-            exec(script, local_env)
-            result = output_buffer.getvalue()
-            
-            # If there was no output, check if the script returned a value
-            if not result and '_return_value' in local_env:
-                result = str(local_env['_return_value'])
-                
-            # Handle figure output if matplotlib was used
-            if 'plt' in local_env and local_env['plt'] is not None:
-                result += "\n[Note: Matplotlib figure was generated but cannot be displayed directly in text. Save it to a file or convert to base64 encoding to view.]"
-                
-            log_message("Script executed successfully")
-            return result if result else "Script executed successfully (no output)"
-            
-        except Exception as e:
-            error_msg = f"Error executing script: {str(e)}\n"
-            error_msg += traceback.format_exc()
-            log_message(f"Script execution error: {str(e)}", 'ERROR')
-            return error_msg
-            
-    finally:
-        # Restore stdout
-        sys.stdout = old_stdout
+        logger.info(f"Successfully loaded stored CSV {csv_id} from {source} with {df.shape[0]} rows and {df.shape[1]} columns")
+        
+        return f"Successfully loaded dataset {csv_id} ({filename}) as '{df_name}'.\n" + \
+               f"Shape: {df.shape[0]} rows x {df.shape[1]} columns\n" + \
+               f"Columns: {', '.join(map(str, df.columns))}\n" + \
+               memory_note
+    
+    except Exception as e:
+        error_msg = f"Error loading dataset: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
 
 @mcp.tool()
-async def get_dataframe_info(df_name: str) -> str:
+async def run_script(script: str, use_cache: bool = False) -> str:
+    """Executes a Python script with access to loaded dataframes.
+    
+    Scripts run in a separate worker process, with CPU-time, memory and
+    wall-clock limits (see MCP_SCRIPT_* settings). With use_cache, the output
+    of a script that reads dataframes without changing them is cached until a
+    dataframe it reads changes.
+    
+    Args:
+        script: The Python script to execute
+        use_cache: Reuse the output of an earlier identical run; only for scripts whose output
+            depends on nothing but the dataframes (no random sampling, clock, files or plots)
+    """
+    # Log script execution
+    log_message(f"Executing script: {script[:100]}{'...' if len(script) > 100 else ''}")
+    
+    try:
+        compiled = script_cache.compile(script)
+    except SyntaxError as e:
+        log_message(f"Script execution error: {str(e)}", 'ERROR')
+        return f"Error executing script: {str(e)}\n" + traceback.format_exc()
+    
+    used_frames = [df_name for df_name in dataframes.names() if df_name in compiled.names]
+    changed = {name for name in compiled.changed if name in dataframes}
+    
+    # Scripts that only read dataframes give the same output until one of those changes;
+    # a script that reads none has nothing that would ever invalidate its output
+    cache_key = None
+    if use_cache and used_frames and not changed:
+        cache_key = script_cache.result_key(compiled, [(df_name, dataframes.version(df_name)) for df_name in used_frames])
+        cached = script_cache.get_result(cache_key)
+        if cached is not None:
+            log_message("Returning cached script output")
+            return cached
+    
+    # Share the loaded dataframes the script uses with the worker
+    frames = {
+        df_name: script_executor.export(df_name, dataframes.version(df_name), dataframes.get(df_name))
+        for df_name in used_frames
+    }
+    
+    result = await script_executor.run(compiled.code, frames)
+    
+    # Keep frames the script replaced or changed in place
+    for df_name, df in result["frames"].items():
+        dataframes.put(df_name, df)
+    script_executor.forget(result["frames"])
+    
+    if result["error"]:
+        log_message(f"Script execution error: {result['error'].splitlines()[0]}", 'ERROR')
+        return result["output"] + result["error"]
+    
+    log_message("Script executed successfully")
+    output = result["output"] if result["output"] else "Script executed successfully (no output)"
+    if cache_key is not None and not result["frames"]:
+        script_cache.put_result(cache_key, output)
+    return output
+
+@mcp.tool()
+async def get_dataframe_info(
+    df_name: str,
+    correlation_columns: Optional[List[str]] = None,
+    sample: Optional[bool] = None
+) -> str:
     """Get information about a loaded DataFrame.
     
     Args:
         df_name: Name of the DataFrame to get info about
+        correlation_columns: Optional numeric columns to correlate (defaults to the
+            first MCP_PROFILE_CORRELATION_COLUMNS numeric columns)
+        sample: Compute statistics on a random sample of rows. Defaults to doing so
+            for frames with more than MCP_PROFILE_SAMPLE_ROWS rows.
     """
     log_message(f"Getting info for DataFrame: {df_name}")
     
     if df_name not in dataframes:
         log_message(f"DataFrame '{df_name}' not found", 'WARNING')
-        return f"Error: DataFrame '{df_name}' not found. Available DataFrames: {list(dataframes.keys())}"
+        return f"Error: DataFrame '{df_name}' not found. Available DataFrames: {dataframes.names()}"
+    
+    df = dataframes.get(df_name)
     
-    df = dataframes[df_name]
+    if isinstance(df, LazyCSVFrame):
+        # Report the statistics gathered while scanning instead of reading the file again
+        rows, cols = df.shape
+        dtypes = "\n".join(f"{column}: {dtype} ({df.summary['missing_values'][column]} missing)" for column, dtype in df.summary["dtypes"].items())
+        sample = pd.DataFrame(df.summary["sample"]).to_string()
+        return f"DataFrame '{df_name}' Information (out of core, {df.path}):\n\n" + \
+               f"{rows} rows x {cols} columns\n{dtypes}\n\n" + \
+               f"Descriptive Statistics:\n{df.describe().to_string()}\n\nSample:\n{sample}"
+    
+    # Profiles are cached per frame version, so repeated calls only cost a lookup
+    version = dataframes.version(df_name)
+    if sample is None:
+        sample = bool(PROFILE_SAMPLE_ROWS) and len(df) > PROFILE_SAMPLE_ROWS
+    sample_rows = min(PROFILE_SAMPLE_ROWS or len(df), len(df)) if sample else len(df)
+    sampled = []
+    def stats_df():
+        # Only sampled when a statistic has to be computed
+        if not sampled:
+            sampled.append(df.sample(n=sample_rows, random_state=0) if sample_rows < len(df) else df)
+        return sampled[0]
+    sample_note = f" (from a random sample of {sample_rows} of {len(df)} rows)" if sample_rows < len(df) else ""
     
     # Generate DataFrame information
-    buffer = io.StringIO()
-    df.info(buf=buffer)
-    info_str = buffer.getvalue()
+    def info():
+        buffer = io.StringIO()
+        df.info(buf=buffer)
+        return buffer.getvalue()
+    info_str = cached_profile((df_name, version, "info"), info)
     
     # Add descriptive statistics
-    desc_stats = df.describe().to_string()
+    desc_stats = cached_profile((df_name, version, "describe", sample_rows), lambda: stats_df().describe().to_string())
     
     # Add correlation information if numerical columns exist
-    num_cols = df.select_dtypes(include=[np.number]).columns
+    num_cols = list(df.select_dtypes(include=[np.number]).columns)
+    if correlation_columns:
+        unknown = [column for column in correlation_columns if column not in num_cols]
+        if unknown:
+            return f"Error: {unknown} are not numeric columns of '{df_name}'. Numeric columns: {num_cols}"
+        corr_cols = list(correlation_columns)
+    else:
+        corr_cols = num_cols[:PROFILE_CORRELATION_COLUMNS]
     corr_str = ""
-    if len(num_cols) > 1:
-        corr = df[num_cols].corr()
-        corr_str = f"\n\nCorrelation Matrix:\n{corr.to_string()}"
+    if len(corr_cols) > 1:
+        corr = cached_profile((df_name, version, "corr", sample_rows, tuple(corr_cols)), lambda: stats_df()[corr_cols].corr().to_string())
+        corr_str = f"\n\nCorrelation Matrix{sample_note}:\n{corr}"
+        if len(corr_cols) < len(num_cols):
+            corr_str += f"\n[{len(num_cols) - len(corr_cols)} more numeric columns; pass correlation_columns to correlate others]"
     
     log_message(f"Successfully retrieved info for DataFrame: {df_name}")
-    return f"DataFrame '{df_name}' Information:\n\n{info_str}\n\nDescriptive Statistics:\n{desc_stats}{corr_str}"
+    return f"DataFrame '{df_name}' Information:\n\n{info_str}\n\nDescriptive Statistics{sample_note}:\n{desc_stats}{corr_str}"
+
+@mcp.tool()
+async def get_cache_stats() -> str:
+    """Report hit rates of the script and profile caches."""
+    stats = script_cache.stats()
+    return "Script cache:\n" + \
+           f"- Compiled scripts: {stats['compiled_entries']} cached, {stats['compile_hits']} hits, " + \
+           f"{stats['compile_misses']} misses ({stats['compile_hit_rate']:.0%} hit rate)\n" + \
+           f"- Script outputs: {stats['result_entries']} cached ({format_bytes(stats['result_bytes'])}), " + \
+           f"{stats['result_hits']} hits, {stats['result_misses']} misses ({stats['result_hit_rate']:.0%} hit rate), " + \
+           f"{stats['result_evictions']} evicted\n" + \
+           f"Profile cache: {len(profile_cache)} of {PROFILE_CACHE_SIZE} entries"
 
 @mcp.tool()
 async def list_dataframes() -> str:
     """List all loaded DataFrames."""
     log_message("Listing all loaded DataFrames")
     
-    if not dataframes:
+    if not len(dataframes):
         return "No DataFrames are currently loaded."
     
     result = "Loaded DataFrames:\n"
-    for name, df in dataframes.items():
-        result += f"- {name}: {df.shape[0]} rows × {df.shape[1]} columns\n"
+    for entry in dataframes.entries():
+        if entry.lazy:
+            location = f"out of core, {format_bytes(entry.disk_bytes)} on disk"
+        elif entry.in_memory:
+            location = f"in memory, {format_bytes(entry.memory_bytes)}"
+            if entry.original_memory_bytes is not None:
+                location += f" with optimized dtypes, was {format_bytes(entry.original_memory_bytes)}"
+        else:
+            location = f"spilled to disk, {format_bytes(entry.disk_bytes)} on disk ({format_bytes(entry.memory_bytes)} when loaded)"
+        result += f"- {entry.name}: {entry.shape[0]} rows × {entry.shape[1]} columns ({location})\n"
     
+    result += f"\nMemory: {format_bytes(dataframes.memory_in_use())} of {format_bytes(dataframes.memory_budget)} budget in use, "
+    result += f"{format_bytes(dataframes.disk_in_use())} spilled to disk"
     return result
 
 if __name__ == "__main__":
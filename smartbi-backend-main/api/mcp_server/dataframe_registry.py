@@ -0,0 +1,257 @@
+"""
+Registry of the DataFrames loaded into the data exploration server.
+Frames are kept in memory up to a configurable budget. When the budget is
+exceeded, the least recently used frames are spilled to Parquet files (pickle
+for frames Parquet can't represent) and reloaded lazily on the next access.
+A manifest of the spilled frames lets them survive a server restart.
+Lazy handles on files read out of core (LazyCSVFrame) can be registered too;
+they take no memory and are never spilled, since their data stays on disk.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from lazy_frame import LazyCSVFrame
+
+MANIFEST_NAME = "manifest.json"
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Return the number of bytes a DataFrame holds, including object contents."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def format_bytes(size: float) -> str:
+    """Format a byte count for humans, e.g. 12.3 MB."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class FrameEntry:
+    """A registered DataFrame, either held in memory or spilled to disk."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.df: Optional[pd.DataFrame] = None
+        self.shape: Tuple[int, int] = (0, 0)
+        self.memory_bytes = 0  # Size in memory when loaded
+        self.original_memory_bytes: Optional[int] = None  # Size before dtype optimization, if it was optimized
+        self.path: Optional[str] = None  # Spill file (or source file of a lazy frame)
+        self.format: Optional[str] = None  # "parquet", "pickle" or "csv" for lazy frames
+        self.summary: Optional[Dict] = None  # Scan summary of a lazy frame
+        self.disk_bytes = 0
+        self.dirty = True  # The in-memory frame differs from the spill file
+        self.version = 0  # Changes every time the frame is replaced or modified
+
+    @property
+    def in_memory(self) -> bool:
+        return self.df is not None
+
+    @property
+    def lazy(self) -> bool:
+        return self.format == "csv"
+
+    def to_manifest(self) -> Dict:
+        return {
+            # Spill files live in the spill directory; lazy frames point at their source
+            "file": self.path if self.lazy else os.path.basename(self.path),
+            "format": self.format,
+            "shape": list(self.shape),
+            "memory_bytes": self.memory_bytes,
+            "original_memory_bytes": self.original_memory_bytes,
+            "disk_bytes": self.disk_bytes,
+            "version": self.version,
+            "summary": self.summary,
+        }
+
+
+class DataFrameRegistry:
+    """Named DataFrames with a memory budget and LRU spilling to disk."""
+
+    def __init__(self, memory_budget: int, spill_dir: str):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.counter = 1  # Used for default names df_1, df_2, ...
+        # Versions are unique across frames, so a name reused for a new frame never repeats one
+        self._last_version = 0
+        # Least recently used first
+        self._entries: "OrderedDict[str, FrameEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(spill_dir, exist_ok=True)
+        self._load_manifest()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def entries(self) -> Iterator[FrameEntry]:
+        return iter(list(self._entries.values()))
+
+    def version(self, name: str) -> int:
+        """Return a number that changes whenever the frame is replaced or modified."""
+        return self._entries[name].version
+
+    def next_name(self) -> str:
+        """Return a new default frame name."""
+        with self._lock:
+            name = f"df_{self.counter}"
+            self.counter += 1
+            self._save_manifest()
+            return name
+
+    def get(self, name: str):
+        """Return a frame (or lazy handle), reloading it from disk if it was spilled."""
+        with self._lock:
+            entry = self._entries[name]
+            self._entries.move_to_end(name)
+            if entry.df is None:
+                entry.df = self._read(entry)
+                entry.dirty = False
+                self._evict(keep=name)
+            return entry.df
+
+    def put(self, name: str, df, original_memory: Optional[int] = None) -> FrameEntry:
+        """Register (or replace) a DataFrame or LazyCSVFrame under a name.
+
+        original_memory is the frame's size before its dtypes were optimized.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.path and not entry.lazy and os.path.exists(entry.path):
+                os.remove(entry.path)
+            entry = FrameEntry(name) if entry is None else entry
+            entry.path = entry.format = entry.summary = None
+            entry.disk_bytes = 0
+            entry.original_memory_bytes = original_memory
+            entry.df = df
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            self._changed(entry)
+            self._evict(keep=name)
+            return entry
+
+    def mark_modified(self, name: str) -> None:
+        """Record that a frame was changed in place."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.df is not None and not entry.lazy:
+                self._changed(entry)
+                self._evict(keep=name)
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            # Never delete the source file of a lazy frame
+            if entry is not None and entry.path and not entry.lazy and os.path.exists(entry.path):
+                os.remove(entry.path)
+            self._save_manifest()
+
+    def memory_in_use(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values() if entry.in_memory)
+
+    def disk_in_use(self) -> int:
+        return sum(entry.disk_bytes for entry in self._entries.values() if entry.path and not entry.lazy)
+
+    def persist(self) -> None:
+        """Write every in-memory frame to disk so that it survives a restart."""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.in_memory and entry.dirty:
+                    self._write(entry)
+            self._save_manifest()
+
+    def _changed(self, entry: FrameEntry) -> None:
+        entry.shape = entry.df.shape
+        self._last_version += 1
+        entry.version = self._last_version
+        if isinstance(entry.df, LazyCSVFrame):
+            entry.path, entry.format, entry.summary = entry.df.path, "csv", entry.df.summary
+            entry.disk_bytes = os.path.getsize(entry.path)
+            entry.memory_bytes = 0
+            entry.dirty = False
+            return
+        entry.memory_bytes = frame_memory(entry.df)
+        entry.dirty = True
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Spill least recently used frames until the in-memory ones fit the budget."""
+        for entry in list(self._entries.values()):
+            if self.memory_in_use() <= self.memory_budget:
+                break
+            # The frame being used stays in memory even if it alone exceeds the budget
+            if entry.name == keep or not entry.in_memory:
+                continue
+            if entry.dirty:
+                self._write(entry)
+            entry.df = None
+        self._save_manifest()
+
+    def _write(self, entry: FrameEntry) -> None:
+        base = os.path.join(self.spill_dir, hashlib.sha1(entry.name.encode("utf-8")).hexdigest()[:16])
+        try:
+            path, fmt = base + ".parquet", "parquet"
+            entry.df.to_parquet(path + ".tmp")
+        except Exception:
+            # Mixed-type object columns and non-string column names don't fit Parquet
+            path, fmt = base + ".pkl", "pickle"
+            entry.df.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if entry.path and entry.path != path and os.path.exists(entry.path):
+            os.remove(entry.path)
+        entry.path, entry.format = path, fmt
+        entry.disk_bytes = os.path.getsize(path)
+        entry.dirty = False
+
+    def _read(self, entry: FrameEntry):
+        if entry.lazy:
+            return LazyCSVFrame(entry.path, entry.summary)
+        if entry.format == "parquet":
+            return pd.read_parquet(entry.path)
+        return pd.read_pickle(entry.path)
+
+    def _load_manifest(self) -> None:
+        path = os.path.join(self.spill_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            manifest = json.load(f)
+        self.counter = manifest.get("counter", 1)
+        for name, item in manifest.get("frames", {}).items():
+            entry = FrameEntry(name)
+            entry.path = os.path.join(self.spill_dir, item["file"])
+            if not os.path.exists(entry.path):
+                continue
+            entry.format = item["format"]
+            entry.summary = item.get("summary")
+            entry.shape = tuple(item["shape"])
+            entry.memory_bytes = item["memory_bytes"]
+            entry.original_memory_bytes = item.get("original_memory_bytes")
+            entry.disk_bytes = item["disk_bytes"]
+            entry.version = item.get("version", 1)
+            self._last_version = max(self._last_version, entry.version)
+            entry.dirty = False
+            self._entries[name] = entry
+
+    def _save_manifest(self) -> None:
+        # Only frames with an up-to-date spill file can be restored
+        frames = {
+            entry.name: entry.to_manifest()
+            for entry in self._entries.values()
+            if entry.path and not entry.dirty
+        }
+        path = os.path.join(self.spill_dir, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"counter": self.counter, "frames": frames}, f)
+        os.replace(path + ".tmp", path)
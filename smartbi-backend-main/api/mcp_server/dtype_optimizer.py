@@ -0,0 +1,93 @@
+"""
+Shrinks the memory footprint of loaded DataFrames by choosing tighter dtypes:
+numeric columns are downcast, text holding full dates is parsed into datetimes,
+low-cardinality text becomes `category` and other text uses Arrow-backed
+strings (when pyarrow is installed).
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:  # pragma: no cover - depends on the installation
+    STRING_DTYPE = None
+
+# Text columns with at most this share of distinct values become categories
+CATEGORY_MAX_RATIO = 0.5
+# Values checked when deciding whether a text column holds dates
+DATE_SAMPLE_SIZE = 1000
+# A day, month and year: 2024-01-31, 31/01/2024, 31.01.24, 31-Jan-2024, 31 January 2024 or Jan 31, 2024.
+# Times alone, month/day pairs and plain numbers would otherwise parse with today's date or year filled in
+DATE_PATTERN = (
+    r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}"
+    r"|\d{1,2}[-/ ][A-Za-z]{3,}\.?[-/ ]\d{2,4}"
+    r"|[A-Za-z]{3,}\.? \d{1,2},? \d{4}"
+)
+# Integers are stored as int32 only within these bounds, leaving scripts room to multiply and add them
+INT32_SAFE_MIN, INT32_SAFE_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+def _downcast_float(series: pd.Series) -> pd.Series:
+    """Use float32 only when every value survives the round trip unchanged."""
+    downcast = series.astype(np.float32)
+    same = (downcast.astype(series.dtype) == series) | series.isna()
+    return downcast if same.all() else series
+
+
+def _downcast_integer(series: pd.Series) -> pd.Series:
+    """
+    Use int32 for small values and keep everything else as loaded. Arithmetic keeps
+    the column's width, so narrower types wrap around in ordinary scripts.
+    """
+    if not isinstance(series.dtype, np.dtype) or series.dtype.itemsize <= 4 or series.empty:
+        return series
+    if series.min() >= INT32_SAFE_MIN and series.max() <= INT32_SAFE_MAX:
+        return series.astype(np.int32)
+    return series
+
+
+def _looks_like_dates(values: pd.Series) -> bool:
+    sample = values.dropna().head(DATE_SAMPLE_SIZE).astype(str)
+    if sample.empty or not sample.str.contains(DATE_PATTERN, regex=True).all():
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(sample, errors="coerce", format="mixed")
+    return parsed.notna().all()
+
+
+def _optimize_text(series: pd.Series) -> pd.Series:
+    if _looks_like_dates(series):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(series, errors="coerce", format="mixed")
+        # Only the sample was checked; keep the text if any later value isn't a date
+        if parsed.notna().sum() == series.notna().sum():
+            return parsed
+    non_null = series.count()
+    if non_null and series.nunique() / non_null <= CATEGORY_MAX_RATIO:
+        return series.astype("category")
+    # Only convert columns that really hold strings (object columns can mix types)
+    if STRING_DTYPE and pd.api.types.infer_dtype(series, skipna=True) == "string":
+        return series.astype(STRING_DTYPE)
+    return series
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of a DataFrame with memory-efficient dtypes."""
+    columns = []
+    for _, series in df.items():
+        if pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            columns.append(series)
+        elif pd.api.types.is_integer_dtype(series):
+            columns.append(_downcast_integer(series))
+        elif pd.api.types.is_float_dtype(series):
+            columns.append(_downcast_float(series))
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            columns.append(_optimize_text(series))
+        else:
+            columns.append(series)
+    return pd.concat(columns, axis=1) if columns else df.copy()
@@ -0,0 +1,56 @@
+"""
+Passing DataFrames between the server and its script worker processes.
+Frames are written as Arrow IPC files into a shared directory (tmpfs at
+/dev/shm where available) and memory-mapped by the reader, so a frame is
+written once per version and never pushed through a pipe. Frames Arrow can't
+represent fall back to pickle files; lazy out-of-core handles are passed as
+their path and summary.
+"""
+import os
+import pickle
+from typing import Any, Dict
+
+import pandas as pd
+import pyarrow as pa
+
+from lazy_frame import LazyCSVFrame
+
+FrameSpec = Dict[str, Any]
+
+
+def write_frame(df, base_path: str) -> FrameSpec:
+    """Write a DataFrame (or describe a lazy handle) and return how to read it back."""
+    if isinstance(df, LazyCSVFrame):
+        return {"kind": "lazy", "path": df.path, "summary": df.summary}
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        path, kind = base_path + ".arrow", "arrow"
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError, ValueError):
+        # Mixed-type object columns and the like don't fit Arrow
+        path, kind = base_path + ".pkl", "pickle"
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    return {"kind": kind, "path": path}
+
+
+def read_frame(spec: FrameSpec):
+    """Read a frame written by write_frame."""
+    if spec["kind"] == "lazy":
+        return LazyCSVFrame(spec["path"], spec["summary"])
+    if spec["kind"] == "arrow":
+        # The Arrow buffers stay backed by the mapped file (which they keep open);
+        # pandas only copies what it can't use as is
+        source = pa.memory_map(spec["path"], "r")
+        return pa.ipc.open_file(source).read_all().to_pandas()
+    with open(spec["path"], "rb") as f:
+        return pickle.load(f)
+
+
+def remove_frame(spec: FrameSpec) -> None:
+    """Delete the file behind a spec (never the source of a lazy handle)."""
+    if spec["kind"] != "lazy" and os.path.exists(spec["path"]):
+        os.remove(spec["path"])
@@ -0,0 +1,131 @@
+"""
+Out-of-core access to CSV files that are too large to load into memory.
+scan_csv reads a file once in chunks to build its summary (shape, dtypes,
+null counts, basic numeric statistics and a sample) and returns a
+LazyCSVFrame handle that reads the data again, chunk by chunk, on demand.
+duckdb is optional; with it installed, handles can also be queried with SQL.
+"""
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - SQL queries are optional
+    duckdb = None
+
+DEFAULT_CHUNKSIZE = 100_000
+SAMPLE_ROWS = 5
+
+
+def merge_dtype(current: Optional[str], new: str) -> str:
+    """Combine the dtypes pandas inferred for the same column in two chunks."""
+    if current is None or current == new:
+        return new
+    try:
+        current_dtype, new_dtype = np.dtype(current), np.dtype(new)
+    except TypeError:
+        return "object"
+    # e.g. int64 in one chunk and float64 (because of missing values) in another
+    if current_dtype.kind in "iuf" and new_dtype.kind in "iuf":
+        return str(np.result_type(current_dtype, new_dtype))
+    return "object"
+
+
+class LazyCSVFrame:
+    """Handle on a CSV file that is read in chunks instead of being loaded."""
+
+    def __init__(self, path: str, summary: Dict[str, Any], chunksize: int = DEFAULT_CHUNKSIZE):
+        self.path = path
+        self.summary = summary
+        self.chunksize = chunksize
+
+    @property
+    def shape(self):
+        return tuple(self.summary["shape"])
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.summary["dtypes"])
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return pd.Series(self.summary["dtypes"])
+
+    def chunks(self, usecols: Optional[List[str]] = None, chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Iterate over the file as DataFrames of at most `chunksize` rows."""
+        return iter(pd.read_csv(self.path, usecols=usecols, chunksize=chunksize or self.chunksize))
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return pd.read_csv(self.path, nrows=n)
+
+    def to_pandas(self, usecols: Optional[List[str]] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+        """Materialize (part of) the file as a regular DataFrame."""
+        return pd.read_csv(self.path, usecols=usecols, nrows=nrows)
+
+    def sql(self, query: str) -> pd.DataFrame:
+        """Run a SQL query (with duckdb) against the file, exposed as the table `frame`."""
+        if duckdb is None:
+            raise RuntimeError("SQL queries need the duckdb package; iterate over chunks() instead")
+        connection = duckdb.connect()
+        try:
+            connection.read_csv(self.path).create_view("frame")
+            return connection.execute(query).df()
+        finally:
+            connection.close()
+
+    def describe(self) -> pd.DataFrame:
+        """Return count/mean/min/max of the numeric columns, computed during the scan."""
+        stats = self.summary["numeric"]
+        return pd.DataFrame({
+            column: {name: stats[column][name] for name in ("count", "mean", "min", "max")}
+            for column in stats
+        })
+
+    def __repr__(self):
+        rows, cols = self.shape
+        return f"<LazyCSVFrame {self.path!r}: {rows} rows x {cols} columns>"
+
+
+def scan_csv(path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> LazyCSVFrame:
+    """Summarize a CSV file in one streaming pass and return a lazy handle on it."""
+    rows = 0
+    dtypes: Dict[str, str] = {}
+    missing: Dict[str, int] = {}
+    numeric: Dict[str, Dict[str, float]] = {}
+    sample = None
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if sample is None:
+            sample = chunk.head(SAMPLE_ROWS)
+        rows += len(chunk)
+        for column, dtype in chunk.dtypes.items():
+            dtypes[column] = merge_dtype(dtypes.get(column), str(dtype))
+        for column, count in chunk.isna().sum().items():
+            missing[column] = missing.get(column, 0) + int(count)
+        for column in chunk.select_dtypes(include=[np.number]).columns:
+            values = chunk[column].dropna()
+            if values.empty:
+                continue
+            stats = numeric.setdefault(column, {"count": 0, "sum": 0.0, "min": np.inf, "max": -np.inf})
+            stats["count"] += int(values.count())
+            stats["sum"] += float(values.sum())
+            stats["min"] = min(stats["min"], float(values.min()))
+            stats["max"] = max(stats["max"], float(values.max()))
+
+    # Columns that turned non-numeric in a later chunk have no meaningful statistics
+    numeric = {
+        column: dict(stats, mean=stats["sum"] / stats["count"])
+        for column, stats in numeric.items()
+        if dtypes[column] != "object"
+    }
+    summary = {
+        "shape": [rows, len(dtypes)],
+        "dtypes": dtypes,
+        "missing_values": missing,
+        "numeric": numeric,
+        "sample": sample.to_dict(orient="list") if sample is not None else {},
+    }
+    return LazyCSVFrame(os.path.abspath(path), summary, chunksize)
@@ -0,0 +1,121 @@
+"""
+Static analysis of run_script code: which loaded DataFrames a script reads
+and which ones it may change. Anything that might modify a frame counts as a
+change, including binding it to another name (in a tuple, a list or a loop)
+and handing it to a function or callback. Static analysis can't follow every
+alias, so this is only a hint: run_script uses it to skip the output cache,
+and the worker compares each frame before and after the script to find what
+really changed.
+"""
+import ast
+from typing import Iterable, Set
+
+# Calls that only read their arguments
+READ_ONLY_CALLS = {
+    "print", "len", "repr", "str", "type", "isinstance", "id", "sorted", "list",
+    "tuple", "set", "dict", "enumerate", "zip", "min", "max", "sum", "any", "all",
+    "round", "abs", "hash", "format", "display",
+}
+
+# DataFrame methods that always change the frame they are called on
+# (most others only do so with inplace=True)
+MUTATING_METHODS = {"insert", "pop", "update", "__setitem__", "__delitem__"}
+
+
+def referenced_names(tree: ast.AST) -> Set[str]:
+    """Return every plain name a script uses."""
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def _base_name(node: ast.AST):
+    """Return the name at the root of an expression like df.loc[0, "a"]."""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _aliased_names(node: ast.AST) -> Iterable[str]:
+    """Return the names an expression hands on as they are, e.g. df in `[df, other]` or `df if c else x`."""
+    if isinstance(node, ast.Name):
+        yield node.id
+    elif isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        for element in node.elts:
+            yield from _aliased_names(element)
+    elif isinstance(node, ast.Dict):
+        for value in node.values:
+            yield from _aliased_names(value)
+    elif isinstance(node, ast.Starred):
+        yield from _aliased_names(node.value)
+    elif isinstance(node, ast.IfExp):
+        yield from _aliased_names(node.body)
+        yield from _aliased_names(node.orelse)
+
+
+def _callback_may_mutate(node: ast.AST, functions: Set[str]) -> bool:
+    """Whether a callback argument, such as the lambda in df.pipe(lambda d: ...), may change what it is given."""
+    if isinstance(node, ast.Lambda):
+        parameters = {argument.arg for argument in node.args.posonlyargs + node.args.args + node.args.kwonlyargs}
+        return bool(mutated_names(node.body) & parameters)
+    # The script's own functions are checked where they are called directly; assume the worst here
+    return isinstance(node, ast.Name) and node.id in functions
+
+
+def _targets(node: ast.AST) -> Iterable[ast.AST]:
+    if isinstance(node, (ast.Tuple, ast.List)):
+        for element in node.elts:
+            yield from _targets(element)
+    elif isinstance(node, ast.Starred):
+        yield from _targets(node.value)
+    else:
+        yield node
+
+
+def mutated_names(tree: ast.AST) -> Set[str]:
+    """Return the names a script may rebind or modify in place."""
+    functions = {
+        node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+    mutated = set()
+    for node in ast.walk(tree):
+        targets = []
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+            # `alias = df` or `a, b = df_1, df_2` lets later statements change df under another name
+            mutated.update(_aliased_names(node.value))
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+            if isinstance(node, ast.AnnAssign) and node.value is not None:
+                mutated.update(_aliased_names(node.value))
+        elif isinstance(node, ast.Delete):
+            targets = node.targets
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.comprehension)):
+            targets = [node.target]
+            # `for d in [df_1, df_2]` binds each frame to the loop variable
+            mutated.update(_aliased_names(node.iter))
+        elif isinstance(node, (ast.With, ast.AsyncWith)):
+            targets = [item.optional_vars for item in node.items if item.optional_vars is not None]
+        elif isinstance(node, ast.NamedExpr):
+            targets = [node.target]
+            mutated.update(_aliased_names(node.value))
+        elif isinstance(node, ast.Call):
+            func = node.func
+            arguments = list(node.args) + [keyword.value for keyword in node.keywords]
+            if isinstance(func, ast.Attribute):
+                inplace = any(
+                    keyword.arg == "inplace" and not (isinstance(keyword.value, ast.Constant) and not keyword.value.value)
+                    for keyword in node.keywords
+                )
+                # df.pipe(callback) and friends hand the frame itself to the callback
+                callback = any(_callback_may_mutate(argument, functions) for argument in arguments)
+                if inplace or callback or func.attr in MUTATING_METHODS:
+                    mutated.add(_base_name(func.value))
+            # Frames passed to the script's own (or other plain) functions and lambdas may be changed by them;
+            # library methods like df.merge(other) or pd.concat([...]) don't modify their arguments
+            elif not (isinstance(func, ast.Name) and func.id in READ_ONLY_CALLS):
+                for argument in arguments:
+                    mutated.update(_aliased_names(argument))
+        for target in targets:
+            for element in _targets(target):
+                mutated.add(_base_name(element))
+    mutated.discard(None)
+    return mutated
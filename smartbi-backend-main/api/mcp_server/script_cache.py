@@ -0,0 +1,103 @@
+"""
+Caches for run_script: compiled scripts and script results.
+Scripts are parsed, analyzed and compiled once per distinct text. Results are
+memoized by the script's syntax tree (so comments and formatting don't
+matter) together with the versions of the DataFrames it reads, so a cached
+result is only returned while none of those frames has changed. run_script
+only memoizes when asked to (use_cache).
+"""
+import ast
+import hashlib
+import marshal
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from script_analysis import mutated_names, referenced_names
+
+
+class CompiledScript:
+    """A parsed and compiled run_script script."""
+
+    def __init__(self, script: str):
+        tree = ast.parse(script)
+        self.names: Set[str] = referenced_names(tree)
+        self.changed: Set[str] = mutated_names(tree)
+        # Marshalled so it can be sent to worker processes as is
+        self.code = marshal.dumps(compile(tree, "<script>", "exec"))
+        # Same for scripts that only differ in comments or formatting
+        self.fingerprint = hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()
+
+
+class ScriptCache:
+    """LRU caches of compiled scripts and of script outputs."""
+
+    def __init__(self, max_compiled: int, max_results: int, max_result_bytes: int):
+        self.max_compiled = max_compiled
+        self.max_results = max_results
+        self.max_result_bytes = max_result_bytes
+        self._compiled: "OrderedDict[str, CompiledScript]" = OrderedDict()
+        self._results: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._result_bytes = 0
+        self.compile_hits = 0
+        self.compile_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+        self.evictions = 0
+
+    def compile(self, script: str) -> CompiledScript:
+        """Return the compiled script, compiling it on first use (may raise SyntaxError)."""
+        key = hashlib.sha256(script.encode("utf-8")).hexdigest()
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self._compiled.move_to_end(key)
+            self.compile_hits += 1
+            return compiled
+        self.compile_misses += 1
+        compiled = CompiledScript(script)
+        self._compiled[key] = compiled
+        while len(self._compiled) > self.max_compiled:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    @staticmethod
+    def result_key(compiled: CompiledScript, frame_versions: Iterable[Tuple[str, int]]) -> Tuple:
+        return (compiled.fingerprint,) + tuple(sorted(frame_versions))
+
+    def get_result(self, key: Tuple) -> Optional[str]:
+        output = self._results.get(key)
+        if output is None:
+            self.result_misses += 1
+            return None
+        self._results.move_to_end(key)
+        self.result_hits += 1
+        return output
+
+    def put_result(self, key: Tuple, output: str) -> None:
+        size = len(output.encode("utf-8"))
+        if size > self.max_result_bytes:
+            return
+        old = self._results.pop(key, None)
+        if old is not None:
+            self._result_bytes -= len(old.encode("utf-8"))
+        self._results[key] = output
+        self._result_bytes += size
+        while len(self._results) > self.max_results or self._result_bytes > self.max_result_bytes:
+            _, evicted = self._results.popitem(last=False)
+            self._result_bytes -= len(evicted.encode("utf-8"))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        compile_lookups = self.compile_hits + self.compile_misses
+        result_lookups = self.result_hits + self.result_misses
+        return {
+            "compiled_entries": len(self._compiled),
+            "compile_hits": self.compile_hits,
+            "compile_misses": self.compile_misses,
+            "compile_hit_rate": self.compile_hits / compile_lookups if compile_lookups else 0.0,
+            "result_entries": len(self._results),
+            "result_bytes": self._result_bytes,
+            "result_hits": self.result_hits,
+            "result_misses": self.result_misses,
+            "result_hit_rate": self.result_hits / result_lookups if result_lookups else 0.0,
+            "result_evictions": self.evictions,
+        }
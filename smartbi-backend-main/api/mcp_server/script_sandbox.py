@@ -0,0 +1,161 @@
+"""
+Runs run_script code in a pool of worker processes (script_worker.py) instead
+of the server process. Each script gets its own output buffer, a CPU-time
+limit and a wall-clock timeout, and workers run under a memory limit; a
+worker that times out or dies is replaced. DataFrames are shared with the
+workers through Arrow IPC files (see frame_ipc), written once per frame version.
+"""
+import asyncio
+import hashlib
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+from typing import Dict, Iterable, Optional, Tuple
+
+from frame_ipc import FrameSpec, read_frame, remove_frame, write_frame
+
+HEADER = struct.Struct("!I")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "script_worker.py")
+
+
+def default_shared_dir() -> str:
+    """Prefer tmpfs so shared frames live in memory rather than on disk."""
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"smartbi-mcp-{os.getpid()}")
+
+
+class ScriptTimeout(Exception):
+    """Raised when a script runs past its wall-clock timeout."""
+
+
+class Worker:
+    """One worker process and its stdin/stdout channel."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+
+    @classmethod
+    async def start(cls, shared_dir: str, memory_bytes: int) -> "Worker":
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT, shared_dir, str(memory_bytes),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        return cls(process)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def run(self, task: Dict, timeout: float) -> Dict:
+        data = pickle.dumps(task)
+        self.process.stdin.write(HEADER.pack(len(data)) + data)
+        await self.process.stdin.drain()
+        try:
+            header = await asyncio.wait_for(self.process.stdout.readexactly(HEADER.size), timeout)
+            body = await self.process.stdout.readexactly(HEADER.unpack(header)[0])
+        except asyncio.TimeoutError:
+            raise ScriptTimeout(f"Script did not finish within {timeout:g} seconds")
+        return pickle.loads(body)
+
+    def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+
+
+class ScriptExecutor:
+    """Pool of worker processes that run scripts in parallel."""
+
+    def __init__(
+        self,
+        max_workers: int,
+        timeout: float,
+        cpu_seconds: int,
+        memory_bytes: int,
+        shared_dir: Optional[str] = None,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.shared_dir = shared_dir or default_shared_dir()
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers = []
+        # Frame name -> (version, spec) of the copy shared with workers
+        self._exported: Dict[str, Tuple[int, FrameSpec]] = {}
+
+    async def _ensure_started(self) -> None:
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.max_workers):
+            worker = await Worker.start(self.shared_dir, self.memory_bytes)
+            self._workers.append(worker)
+            self._idle.put_nowait(worker)
+
+    def export(self, name: str, version: int, df) -> FrameSpec:
+        """Share a frame with the workers, reusing the copy of the same version."""
+        exported = self._exported.get(name)
+        if exported and exported[0] == version:
+            return exported[1]
+        if exported:
+            remove_frame(exported[1])
+        base = os.path.join(self.shared_dir, f"{hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]}-{version}")
+        spec = write_frame(df, base)
+        self._exported[name] = (version, spec)
+        return spec
+
+    def forget(self, names: Iterable[str]) -> None:
+        """Drop the shared copies of frames that were replaced."""
+        for name in names:
+            exported = self._exported.pop(name, None)
+            if exported:
+                remove_frame(exported[1])
+
+    async def run(self, code: bytes, frames: Dict[str, FrameSpec]) -> Dict:
+        """Run a script, compiled and marshalled, in a free worker.
+
+        Returns a dict with the script's "output", an "error" message or None,
+        and "frames": the DataFrames the script replaced or changed, by name.
+        """
+        await self._ensure_started()
+        task = {"code": code, "frames": frames, "cpu_seconds": self.cpu_seconds}
+
+        worker = await self._idle.get()
+        try:
+            response = await worker.run(task, self.timeout)
+        except (ScriptTimeout, asyncio.IncompleteReadError, ConnectionError) as e:
+            worker.kill()
+            if isinstance(e, ScriptTimeout):
+                error = f"Error executing script: {str(e)}"
+            else:
+                error = "Error executing script: the worker process died (it may have exceeded its memory or CPU limit)"
+            worker = await self._replace(worker)
+            return {"output": "", "error": error, "frames": {}}
+        finally:
+            self._idle.put_nowait(worker)
+
+        changed_frames = {}
+        for name, spec in response["frames"].items():
+            try:
+                changed_frames[name] = read_frame(spec)
+            finally:
+                remove_frame(spec)
+        response["frames"] = changed_frames
+        return response
+
+    async def _replace(self, worker: Worker) -> Worker:
+        self._workers.remove(worker)
+        new_worker = await Worker.start(self.shared_dir, self.memory_bytes)
+        self._workers.append(new_worker)
+        return new_worker
+
+    def close(self) -> None:
+        """Stop every worker and delete the shared frames."""
+        for worker in self._workers:
+            worker.kill()
+        shutil.rmtree(self.shared_dir, ignore_errors=True)
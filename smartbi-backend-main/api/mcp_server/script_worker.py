@@ -0,0 +1,142 @@
+"""
+Worker process for run_script, started by script_sandbox.ScriptExecutor.
+Reads length-prefixed pickled tasks from stdin, runs each script with the
+DataFrames it uses, and writes the result back on stdout. Each task runs under
+a CPU-time limit, and the whole process under a memory limit.
+"""
+import contextlib
+import io
+import marshal
+import os
+import pickle
+import signal
+import struct
+import sys
+import traceback
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from frame_ipc import read_frame, write_frame
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+HEADER = struct.Struct("!I")
+
+
+def fingerprint(df: pd.DataFrame):
+    """Summarize a frame's labels, dtypes and values, to tell whether a script changed it."""
+    try:
+        values = int(pd.util.hash_pandas_object(df, index=True).sum())
+    except TypeError:
+        # Cells holding unhashable objects (lists, dicts, ...) can't be hashed; assume a change
+        values = uuid.uuid4().hex
+    return (df.shape, tuple(map(str, df.columns)), tuple(map(str, df.dtypes)), values)
+
+
+class CPUTimeExceeded(Exception):
+    """Raised in a script that used up its CPU time."""
+
+
+def on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded("Script exceeded its CPU time limit")
+
+
+def limit_memory(memory_bytes: int) -> None:
+    if resource is None or not memory_bytes:
+        return
+    # RLIMIT_DATA covers heap and anonymous mappings but not the memory-mapped frame files
+    limit = getattr(resource, "RLIMIT_DATA", resource.RLIMIT_AS)
+    resource.setrlimit(limit, (memory_bytes, memory_bytes))
+
+
+@contextlib.contextmanager
+def cpu_limit(seconds: int):
+    """Allow the block `seconds` of CPU time from now (the limit is cumulative per process)."""
+    if resource is None or not seconds:
+        yield
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, hard))
+
+
+def run_task(task, shared_dir: str):
+    """Run one script and return its output and the frames it changed."""
+    output_buffer = io.StringIO()
+    local_env = {
+        'pd': pd,
+        'np': np,
+        'plt': None,  # Will be imported in the script if needed
+    }
+    for name, spec in task["frames"].items():
+        local_env[name] = read_frame(spec)
+    originals = {name: local_env[name] for name in task["frames"]}
+    # Taken before the script runs, so that changes made under any other name are found too
+    fingerprints = {name: fingerprint(df) for name, df in originals.items() if isinstance(df, pd.DataFrame)}
+
+    error = None
+    try:
+        with contextlib.redirect_stdout(output_buffer), cpu_limit(task["cpu_seconds"]):
+            # The server sends the script already compiled
+            exec(marshal.loads(task["code"]), local_env)
+    except MemoryError:
+        error = "Error executing script: the script ran out of memory\n" + traceback.format_exc()
+    except Exception as e:
+        error = f"Error executing script: {str(e)}\n" + traceback.format_exc()
+
+    result = output_buffer.getvalue()
+    if not result and '_return_value' in local_env:
+        result = str(local_env['_return_value'])
+    if 'plt' in local_env and local_env['plt'] is not None:
+        result += "\n[Note: Matplotlib figure was generated but cannot be displayed directly in text. Save it to a file or convert to base64 encoding to view.]"
+
+    # Send back the frames the script replaced or changed in place
+    frames = {}
+    if error is None:
+        for name in task["frames"]:
+            df = local_env.get(name)
+            if not isinstance(df, pd.DataFrame):
+                continue
+            if df is not originals[name] or fingerprint(df) != fingerprints.get(name):
+                frames[name] = write_frame(df, os.path.join(shared_dir, f"result-{uuid.uuid4().hex}"))
+    return {"output": result, "error": error, "frames": frames}
+
+
+def main():
+    shared_dir, memory_bytes = sys.argv[1], int(sys.argv[2])
+    # Keep the real stdout for results; anything the script writes to fd 1 goes to stderr
+    channel_in = sys.stdin.buffer
+    channel_out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    limit_memory(memory_bytes)
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, on_cpu_limit)
+
+    while True:
+        header = channel_in.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+        task = pickle.loads(channel_in.read(HEADER.unpack(header)[0]))
+        try:
+            response = run_task(task, shared_dir)
+        except BaseException as e:  # Frames that could not be read, or a limit hit outside the script
+            response = {"output": "", "error": f"Error executing script: {str(e)}", "frames": {}}
+        data = pickle.dumps(response)
+        channel_out.write(HEADER.pack(len(data)) + data)
+        channel_out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Client-side rate limiting for calls to the Groq API.
+Each model gets a request bucket and a token bucket. Bucket state can live in
+a small SQLite file so that every uvicorn worker on the machine draws from the
+same quota; its blocking calls run in the thread pool, off the event loop.
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .settings import (
+    GROQ_BACKOFF_BASE,
+    GROQ_BACKOFF_MAX,
+    GROQ_MODEL_RATE_LIMITS,
+    GROQ_RATE_LIMIT_STATE,
+    GROQ_REQUESTS_PER_MINUTE,
+    GROQ_TOKENS_PER_MINUTE,
+)
+
+# Rough token cost of an image in a vision prompt
+IMAGE_TOKEN_ESTIMATE = 1500
+
+# (bucket key, amount, refill rate per second, capacity)
+BucketRequest = Tuple[str, float, float, float]
+
+
+class MemoryBucketStore:
+    """Token bucket state kept in this process only."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, requests: List[BucketRequest]) -> float:
+        """Take from every bucket at once, or from none.
+
+        Returns 0 on success, otherwise the number of seconds to wait before
+        all buckets could have enough tokens.
+        """
+        with self._lock:
+            now = time.time()
+            levels = {}
+            wait = 0.0
+            for key, amount, rate, capacity in requests:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels[key] = tokens
+                if tokens < amount:
+                    wait = max(wait, (amount - tokens) / rate)
+
+            for key, amount, _, _ in requests:
+                self._buckets[key] = (levels[key] - (0 if wait else amount), now)
+            return wait
+
+    def adjust(self, key: str, rate: float, capacity: float, delta: float = 0.0, maximum: Optional[float] = None) -> None:
+        """Add tokens to a bucket (e.g. to refund an overestimate) and/or cap its level."""
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate + delta)
+            if maximum is not None:
+                tokens = min(tokens, maximum)
+            self._buckets[key] = (tokens, now)
+
+
+class SQLiteBucketStore:
+    """Token bucket state shared between processes through a SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._created = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # The file is created on first use rather than when the module is imported
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        if not self._created:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._created = True
+        return conn
+
+    def take(self, requests: List[BucketRequest]) -> float:
+        """Take from every bucket at once, or from none (see MemoryBucketStore.take)."""
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across workers
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            levels = {}
+            wait = 0.0
+            for key, amount, rate, capacity in requests:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels[key] = tokens
+                if tokens < amount:
+                    wait = max(wait, (amount - tokens) / rate)
+
+            for key, amount, _, _ in requests:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, levels[key] - (0 if wait else amount), now),
+                )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def adjust(self, key: str, rate: float, capacity: float, delta: float = 0.0, maximum: Optional[float] = None) -> None:
+        """Add tokens to a bucket (e.g. to refund an overestimate) and/or cap its level."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate + delta)
+            if maximum is not None:
+                tokens = min(tokens, maximum)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class RateLimiter:
+    """Per-model request and token buckets with backoff for 429 responses."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = GROQ_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = GROQ_TOKENS_PER_MINUTE,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        state_path: Optional[str] = GROQ_RATE_LIMIT_STATE,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits or {}
+        # A bucket with a zero rate would never refill
+        rates = [requests_per_minute, tokens_per_minute]
+        rates += [value for limits in self.model_limits.values() for value in limits.values()]
+        if any(rate <= 0 for rate in rates):
+            raise ValueError("Rate limits must be positive")
+        self.store = SQLiteBucketStore(state_path) if state_path else MemoryBucketStore()
+
+    def limits_for(self, model: str) -> Tuple[float, float]:
+        """Return the (requests, tokens) per minute allowed for a model."""
+        limits = self.model_limits.get(model, {})
+        return limits.get("rpm", self.requests_per_minute), limits.get("tpm", self.tokens_per_minute)
+
+    def _buckets(self, model: str, tokens: float) -> List[BucketRequest]:
+        rpm, tpm = self.limits_for(model)
+        return [
+            (f"requests:{model}", 1.0, rpm / 60.0, max(rpm, 1.0)),
+            (f"tokens:{model}", min(tokens, tpm), tpm / 60.0, tpm),
+        ]
+
+    async def acquire(self, model: str, tokens: float) -> None:
+        """Wait until a request using about `tokens` tokens fits within the model's quota."""
+        buckets = self._buckets(model, tokens)
+        while True:
+            wait = await run_in_threadpool(self.store.take, buckets)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def refund(self, model: str, tokens: float) -> None:
+        """Return tokens that were reserved but not used."""
+        if tokens > 0:
+            _, tpm = self.limits_for(model)
+            await run_in_threadpool(self.store.adjust, f"tokens:{model}", tpm / 60.0, tpm, delta=tokens)
+
+    async def penalize(self, model: str, retry_after: float) -> None:
+        """Drain the model's request bucket so that no worker sends a request for `retry_after` seconds."""
+        rpm, _ = self.limits_for(model)
+        rate = rpm / 60.0
+        # One request becomes available again exactly retry_after seconds from now
+        await run_in_threadpool(self.store.adjust, f"requests:{model}", rate, max(rpm, 1.0), maximum=1.0 - retry_after * rate)
+
+    @staticmethod
+    def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+        """Return how long to wait before retry number `attempt` (0-based).
+
+        A server-provided retry-after wins; otherwise use exponential backoff
+        with full jitter.
+        """
+        if retry_after is not None:
+            return min(retry_after, GROQ_BACKOFF_MAX)
+        return random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt)))
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Estimate the tokens a chat completion will count against the quota."""
+    tokens = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            tokens += len(content) // 4 + 4
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4 + 4
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens + max_tokens
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Read the retry-after header of a 429 response, in seconds."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+# Limiter shared by every GroqClient in the process (and, through the state file, across workers)
+rate_limiter = RateLimiter(model_limits=json.loads(GROQ_MODEL_RATE_LIMITS) if GROQ_MODEL_RATE_LIMITS else None)
@@ -0,0 +1,104 @@
+"""
+Content-addressed file storage.
+Files are stored on disk under the SHA-256 of their content, so identical
+uploads are only kept once and database rows only need to keep the hash.
+"""
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+from .settings import STORAGE_DIR
+
+
+class StoreWriter:
+    """Streams data into a temporary file while hashing it."""
+
+    def __init__(self, store: "ContentStore"):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._done = False
+
+    def write(self, data: bytes) -> None:
+        """Append a chunk of data to the file being written."""
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self) -> str:
+        """Move the written file into the store and return its hash."""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        target = self.store.path_for(digest)
+        if os.path.exists(target):
+            # Same content is already stored, keep the existing copy
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self._tmp_path, target)
+        self._done = True
+        return digest
+
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        if self._done:
+            return
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._done = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Anything that was not committed explicitly is thrown away
+        self.abort()
+        return False
+
+
+class ContentStore:
+    """Content-addressed file store keyed by the SHA-256 of each file."""
+
+    def __init__(self, root: str, suffix: str = ""):
+        self.root = root
+        self.suffix = suffix
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path_for(self, digest: str, suffix: Optional[str] = None) -> str:
+        """Return the on-disk path of a stored file (or a derived artifact of it)."""
+        suffix = self.suffix if suffix is None else suffix
+        return os.path.join(self.root, digest[:2], f"{digest}{suffix}")
+
+    def exists(self, digest: str, suffix: Optional[str] = None) -> bool:
+        return os.path.exists(self.path_for(digest, suffix))
+
+    def open(self, digest: str, suffix: Optional[str] = None) -> BinaryIO:
+        """Open a stored file for binary reading."""
+        return open(self.path_for(digest, suffix), "rb")
+
+    def writer(self) -> StoreWriter:
+        """Start writing a new file; call commit() on the writer to store it."""
+        return StoreWriter(self)
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store an in-memory value and return its hash."""
+        with self.writer() as writer:
+            writer.write(data)
+            return writer.commit()
+
+    def delete(self, digest: str, suffix: Optional[str] = None) -> None:
+        path = self.path_for(digest, suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Store for CSV files uploaded directly or extracted from images
+csv_store = ContentStore(os.path.join(STORAGE_DIR, "csv"), suffix=".csv")
+
+# Store for images sent along with LLM prompts
+image_store = ContentStore(os.path.join(STORAGE_DIR, "images"))
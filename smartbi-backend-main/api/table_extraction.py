@@ -0,0 +1,126 @@
+"""
+Table extraction from images.
+Images are downscaled and, when tall, cut into overlapping horizontal bands
+(see image_processing). The bands are sent to the vision model concurrently
+and their partial CSVs are stitched back together: repeated header rows and
+rows read twice in the overlap between two bands are dropped.
+"""
+import asyncio
+import csv
+import io
+from typing import List, Sequence, Tuple
+
+from .image_processing import image_preprocessor, sniff_mime
+from .settings import (
+    TABLE_BAND_HEIGHT,
+    TABLE_BAND_OVERLAP,
+    TABLE_EXTRACTION_CONCURRENCY,
+    TABLE_IMAGE_MAX_WIDTH,
+)
+
+TABLE_EXTRACTION_PROMPT = "Extract the table from this image and convert it to CSV format. Only provide the raw CSV data without any explanations, markdown formatting, or code blocks."
+BAND_EXTRACTION_PROMPT = (
+    "This image is part {index} of {count} of a table that was cut into horizontal bands which overlap slightly. "
+    "Extract the table rows in this part and convert them to CSV format. Start with the header row only if the "
+    "column headers are visible in this part, and skip any row that is cut off at the top or bottom edge. "
+    "Only provide the raw CSV data without any explanations, markdown formatting, or code blocks."
+)
+CONTINUE_PROMPT = "Your answer was cut off. Continue the CSV from the next row, without repeating any row you already wrote. Only provide the raw CSV data."
+EXTRACTION_FAILED = "Error: Could not extract CSV data from the image"
+EXTRACTION_TRUNCATED = "Error: The table is too long to extract completely; raise TABLE_EXTRACTION_MAX_CONTINUATIONS or TABLE_EXTRACTION_MAX_TOKENS"
+
+# Rows two neighbouring bands can both contain
+MAX_OVERLAP_ROWS = 20
+
+
+class TruncatedTableError(Exception):
+    """Raised when the model's answer is still cut off after every continuation."""
+
+
+def strip_code_fences(text: str) -> str:
+    """Keep only what is inside ``` fences, if the model used any (an unclosed fence runs to the end).
+
+    A fence with a language tag (```csv) always opens, since a continued
+    answer may open a new fence without closing the previous one. Text with
+    only a closing fence keeps everything but the fence.
+    """
+    if "```" not in text:
+        return text.strip()
+    lines, outside, inside = [], [], False
+    for line in text.splitlines():
+        fence = line.strip()
+        if fence.startswith("```"):
+            inside = not inside or fence != "```"
+            continue
+        (lines if inside else outside).append(line)
+    return "\n".join(lines if any(line.strip() for line in lines) else outside).strip()
+
+
+def csv_rows(text: str) -> List[List[str]]:
+    """Parse CSV text, skipping blank rows."""
+    return [row for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row)]
+
+
+def row_key(row: Sequence[str]) -> Tuple[str, ...]:
+    """Compare rows ignoring case and surrounding whitespace, which the model doesn't reproduce exactly."""
+    return tuple(cell.strip().lower() for cell in row)
+
+
+def stitch_csv(parts: Sequence[str]) -> str:
+    """Join the CSVs extracted from consecutive bands into one table."""
+    header = None
+    rows: List[List[str]] = []
+    for part in parts:
+        part_rows = csv_rows(part)
+        if not part_rows:
+            continue
+        if header is None:
+            header, part_rows = part_rows[0], part_rows[1:]
+        elif row_key(part_rows[0]) == row_key(header):
+            part_rows = part_rows[1:]
+
+        # Drop the rows at the top of this band that the previous band already ended with
+        overlap = 0
+        for size in range(min(len(rows), len(part_rows), MAX_OVERLAP_ROWS), 0, -1):
+            if [row_key(row) for row in rows[-size:]] == [row_key(row) for row in part_rows[:size]]:
+                overlap = size
+                break
+        rows.extend(part_rows[overlap:])
+
+    if header is None:
+        return ""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+async def extract_table(groq_client, image_bytes: bytes) -> str:
+    """Extract the table in an image as CSV, splitting tall images into bands extracted concurrently.
+
+    groq_client is the GroqClient whose extract_csv runs each request.
+    """
+    try:
+        bands = await image_preprocessor.split_into_bands(
+            image_bytes, TABLE_IMAGE_MAX_WIDTH, TABLE_BAND_HEIGHT, TABLE_BAND_OVERLAP
+        )
+    except ValueError:
+        # Formats Pillow can't read go to the model as they are
+        bands = [(image_bytes, sniff_mime(image_bytes) or "image/jpeg")]
+
+    if len(bands) == 1:
+        band_bytes, mime_type = bands[0]
+        return await groq_client.extract_csv(band_bytes, TABLE_EXTRACTION_PROMPT, mime_type)
+
+    semaphore = asyncio.Semaphore(TABLE_EXTRACTION_CONCURRENCY)
+
+    async def extract_band(index: int, band_bytes: bytes, mime_type: str) -> str:
+        async with semaphore:
+            prompt = BAND_EXTRACTION_PROMPT.format(index=index + 1, count=len(bands))
+            return await groq_client.extract_csv(band_bytes, prompt, mime_type)
+
+    parts = await asyncio.gather(*(
+        extract_band(index, band_bytes, mime_type) for index, (band_bytes, mime_type) in enumerate(bands)
+    ))
+    return stitch_csv(parts)
@@ -1,21 +1,88 @@
 import asyncio
+import hashlib
 import sys
 import json
 from typing import Optional, List, Dict, Any
 from contextlib import AsyncExitStack
-import re
 import os
 
 import groq  # Import the entire module instead of specific class
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+import mcp.types as types
 
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# How many independent tool calls may run at the same time
+MAX_CONCURRENT_TOOL_CALLS = int(os.getenv("MCP_MAX_CONCURRENT_TOOL_CALLS", "4"))
+# Rounds of tool calls per query; with more than one, the model sees the results and may call more tools
+MAX_TOOL_STEPS = int(os.getenv("MCP_MAX_TOOL_STEPS", "1"))
+# Tools that change the server's state; calls before and after them must not overlap with them
+STATEFUL_TOOLS = {"load_csv", "load_dataset", "run_script"}
+# Estimated tokens of conversation history sent with each model call; older queries are dropped first
+HISTORY_TOKEN_BUDGET = int(os.getenv("MCP_HISTORY_TOKEN_BUDGET", "6000"))
+
+SYSTEM_PROMPT = """You are a helpful assistant that can use tools to help users. Call the tools you need; independent tool calls may be made together in one reply.
+When asked about data analysis, ALWAYS use the appropriate data exploration tool."""
+
+
+def tool_definitions(tools: List[types.Tool]) -> List[Dict[str, Any]]:
+    """Describe MCP tools in the function-calling format of the chat completions API."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description or "",
+                "parameters": tool.inputSchema,
+            },
+        }
+        for tool in tools
+    ]
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Roughly count a message's tokens (about 4 characters per token)."""
+    text = message.get("content") or ""
+    for tool_call in message.get("tool_calls") or []:
+        text += tool_call["function"]["name"] + tool_call["function"]["arguments"]
+    return len(text) // 4 + 4
+
+
+def trim_history(history: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Drop the oldest queries, with their tool calls and answers, until the history fits the budget.
+    
+    The current (last) query is always kept whole, so tool calls stay paired with their results.
+    """
+    starts = [i for i, message in enumerate(history) if message["role"] == "user"]
+    total = sum(estimate_tokens(message) for message in history)
+    for start, next_start in zip(starts, starts[1:]):
+        if total <= budget:
+            return history[start:]
+        total -= sum(estimate_tokens(message) for message in history[start:next_start])
+    return history[starts[-1]:] if starts else history
+
+
+def tool_call_batches(tool_calls: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split tool calls, in order, into batches that can run concurrently.
+    
+    Consecutive calls to read-only tools share a batch; a call to a stateful
+    tool gets a batch of its own, so it sees the effects of every earlier call
+    and later calls see its effects.
+    """
+    batches = []
+    for tool_call in tool_calls:
+        stateful = tool_call["name"] in STATEFUL_TOOLS
+        if stateful or not batches or batches[-1][0]["name"] in STATEFUL_TOOLS:
+            batches.append([tool_call])
+        else:
+            batches[-1].append(tool_call)
+    return batches
+
 class GroqClient:
     def __init__(self, model_name: str = "llama-3.2-90b-vision-preview"):
         """Initialize Groq client with API key and model."""
@@ -26,6 +93,15 @@ class GroqClient:
         self.client = groq.Client(api_key=api_key)  # Use Client instead of Groq
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
+        self.tool_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+        # Tool definitions and the fingerprint of the schemas they were built from
+        self.tools: List[types.Tool] = []
+        self.tool_definitions: List[Dict[str, Any]] = []
+        self.tools_fingerprint: Optional[str] = None
+        self.tools_stale = False
+        # Conversation so far (without the system prompt)
+        self.history: List[Dict[str, Any]] = []
+        self.prompt_tokens = 0
 
     async def connect_to_server(self, server_script_path: str):
         """Connect to an MCP server"""
@@ -43,168 +119,142 @@ class GroqClient:
 
         stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
         self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write, message_handler=self.handle_message)
+        )
 
         await self.session.initialize()
 
         # List available tools
-        response = await self.session.list_tools()
-        self.tools = response.tools
-        print(self.tools)
+        await self.refresh_tools()
         print("\nConnected to server with tools:", [tool.name for tool in self.tools])
 
-    async def generate_response(self, messages: List[Dict[str, Any]]) -> str:
+    async def handle_message(self, message) -> None:
+        """Note when the server says its tool list changed"""
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self.tools_stale = True
+
+    async def refresh_tools(self) -> None:
+        """Fetch the server's tools and rebuild the tool definitions if their schemas changed"""
+        response = await self.session.list_tools()
+        self.tools_stale = False
+        definitions = tool_definitions(response.tools)
+        fingerprint = hashlib.sha256(json.dumps(definitions, sort_keys=True).encode("utf-8")).hexdigest()
+        if fingerprint != self.tools_fingerprint:
+            self.tools = response.tools
+            self.tool_definitions = definitions
+            self.tools_fingerprint = fingerprint
+
+    async def generate_response(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate a response using Groq
         
         Args:
             messages: List of message dictionaries
+        
+        Returns:
+            The assistant message, with any tool calls the model made
         """
-        # Format messages for Groq
-        prompt = """You are a helpful assistant that can use tools to help users. When you need to use a tool, format your response like this:
-[TOOL_CALL]tool_name:{"arg1": value1, "arg2": value2}[/TOOL_CALL]
+        if self.tools_stale:
+            await self.refresh_tools()
 
-Available tools:
-"""
-        
-        # Add tool descriptions based on what's available from the server
-        tool_names = [tool.name for tool in self.tools]
-        
-        if "calculate" in tool_names:
-            prompt += """- calculate: Performs basic arithmetic operations
-  Arguments:
-    - operation: "add", "subtract", "multiply", or "divide"
-    - a: First number
-    - b: Second number
-  Example: [TOOL_CALL]calculate:{"operation": "add", "a": 5, "b": 3}[/TOOL_CALL]
-"""
-
-        if "list_channels" in tool_names:
-            prompt += """- list_channels: Lists all available Discord channels and their IDs
-  No arguments needed
-  Example: [TOOL_CALL]list_channels:{}[/TOOL_CALL]
-"""
-
-        if "send_message" in tool_names:
-            prompt += """- send_message: Sends a message to a specific Discord channel
-  Arguments:
-    - channel_id: The numeric ID of the channel to send to
-    - message: The text message to send
-  Example: [TOOL_CALL]send_message:{"channel_id": 123456789, "message": "Hello from the assistant!"}[/TOOL_CALL]
-"""
-
-        # Add data exploration tools
-        if "load_csv" in tool_names:
-            prompt += """- load_csv: Loads a CSV file into a pandas DataFrame
-  Arguments:
-    - csv_path: Path to the CSV file
-    - df_name: (optional) Name for the DataFrame
-  Example: [TOOL_CALL]load_csv:{"csv_path": "data/housing.csv", "df_name": "housing_data"}[/TOOL_CALL]
-"""
-
-        if "run_script" in tool_names:
-            prompt += """- run_script: Executes a Python script with access to loaded DataFrames
-  Arguments:
-    - script: The Python script to execute
-  Example: [TOOL_CALL]run_script:{"script": "import matplotlib.pyplot as plt\\nplt.figure()\\ndf_1.plot()\\nplt.savefig('plot.png')\\nprint('Plot saved!')"}}[/TOOL_CALL]
-"""
-
-        if "get_dataframe_info" in tool_names:
-            prompt += """- get_dataframe_info: Gets detailed information about a loaded DataFrame
-  Arguments:
-    - df_name: Name of the DataFrame
-  Example: [TOOL_CALL]get_dataframe_info:{"df_name": "df_1"}[/TOOL_CALL]
-"""
-
-        if "list_dataframes" in tool_names:
-            prompt += """- list_dataframes: Lists all loaded DataFrames
-  No arguments needed
-  Example: [TOOL_CALL]list_dataframes:{}[/TOOL_CALL]
-"""
-
-        prompt += "\nWhen asked about data analysis, ALWAYS use the appropriate data exploration tool.\n\n"
-        prompt += "Now, let's handle the user's query:\n"
-
-        # Add user messages to prompt
-        formatted_messages = [{"role": "system", "content": prompt}]
-        
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if isinstance(content, list):
-                content = " ".join(item.get("text", "") for item in content if item.get("type") == "text")
-            formatted_messages.append({"role": role, "content": content})
+        formatted_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + trim_history(messages, HISTORY_TOKEN_BUDGET)
 
         # Make API call
         try:
             completion = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=formatted_messages,
+                tools=self.tool_definitions or None,
+                tool_choice="auto" if self.tool_definitions else None,
                 temperature=0.7,
                 max_tokens=1000,
                 top_p=1,
                 stream=False
             )
-            
-            return completion.choices[0].message.content
         except Exception as e:
             print(f"Error calling Groq API: {str(e)}")
-            return f"Error: {str(e)}"
+            return {"role": "assistant", "content": f"Error: {str(e)}"}
+
+        if completion.usage is not None:
+            self.prompt_tokens += completion.usage.prompt_tokens
+        message = completion.choices[0].message
+        response = {"role": "assistant", "content": message.content or ""}
+        if message.tool_calls:
+            response["tool_calls"] = [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+                }
+                for tool_call in message.tool_calls
+            ]
+        return response
+
+    async def call_tool(self, tool_name: str, tool_args_str: str) -> str:
+        """Run one parsed tool call and return its result (or error) as text"""
+        tool_name = tool_name.strip()
+        try:
+            # Clean and parse tool arguments
+            tool_args = json.loads(tool_args_str.strip())
+            
+            async with self.tool_semaphore:
+                print(f"\nCalling tool: {tool_name} with args: {tool_args}")
+                result = await self.session.call_tool(tool_name, tool_args)
+            
+            text = "".join(content.text for content in result.content if content.type == "text")
+            if result.isError:
+                return f"Error executing tool {tool_name}: {text}"
+            return f"[Tool Result: {tool_name}] {text}"
+        except Exception as e:
+            return f"Error executing tool {tool_name}: {str(e)}"
 
-    async def process_query(self, query: str) -> str:
-        """Process a query using Groq and available tools"""
-        messages = [{"role": "user", "content": query}]
+    async def run_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[str]:
+        """Run tool calls, concurrently where they are independent, and return results in call order"""
+        results = []
+        for batch in tool_call_batches(tool_calls):
+            batch_results = await asyncio.gather(*(self.call_tool(call["name"], call["arguments"]) for call in batch))
+            for result in batch_results:
+                print(result)
+            results.extend(batch_results)
+        return results
+
+    async def process_query(self, query: str, max_steps: int = MAX_TOOL_STEPS) -> str:
+        """Process a query using Groq and available tools
         
-        # Get initial response from Groq
-        response = await self.generate_response(messages)
+        Args:
+            query: The user's query
+            max_steps: Rounds of tool calls to allow; the loop ends earlier once the model stops calling tools
+        """
+        self.history.append({"role": "user", "content": query})
         
-        # Check if response contains tool calls with better regex pattern
-        tool_call_pattern = r'\[TOOL_CALL\](.*?):(.*?)\[/TOOL_CALL\]'
-        tool_calls = re.findall(tool_call_pattern, response)
+        # Get initial response from Groq
+        response = await self.generate_response(self.history)
+        parts = [response["content"]]
         
-        if tool_calls:
-            results = []
-            for tool_name, tool_args_str in tool_calls:
-                try:
-                    # Clean and parse tool arguments
-                    tool_args = json.loads(tool_args_str.strip())
-                    
-                    # Execute tool call
-                    print(f"\nCalling tool: {tool_name} with args: {tool_args}")
-                    
-                    # Handle streaming response
-                    current_result = ""
-                    async for result in self.session.call_tool(tool_name, tool_args):
-                        if isinstance(result.content, list):
-                            for content in result.content:
-                                if content.type == "text":
-                                    current_result += content.text
-                                    print(content.text, end="", flush=True)
-                    
-                    print()  # New line after streaming
-                    
-                    # Add the result
-                    results.append(f"[Tool Result: {tool_name}] {current_result}")
-                    
-                    # Add tool result to messages
-                    messages.append({"role": "assistant", "content": f"I'll use the {tool_name} tool."})
-                    messages.append({
-                        "role": "user",
-                        "content": f"Tool result: {current_result}"
-                    })
-                except Exception as e:
-                    error_msg = f"Error executing tool {tool_name}: {str(e)}"
-                    print(error_msg)
-                    results.append(error_msg)
-                    messages.append({
-                        "role": "user",
-                        "content": f"Error: {error_msg}"
-                    })
+        for _ in range(max(max_steps, 1)):
+            if not response.get("tool_calls"):
+                break
+            
+            tool_calls = [
+                {"id": call["id"], "name": call["function"]["name"], "arguments": call["function"]["arguments"]}
+                for call in response["tool_calls"]
+            ]
+            results = await self.run_tool_calls(tool_calls)
+            parts.append("".join(results))
             
-            # Get final response with all tool results
-            final_response = await self.generate_response(messages)
-            return f"{response}\n\n{''.join(results)}\n\n{final_response}"
+            # Add the tool calls and their results to the history
+            self.history.append(response)
+            for tool_call, result in zip(tool_calls, results):
+                self.history.append({"role": "tool", "tool_call_id": tool_call["id"], "content": result})
+            
+            # Get the next response with all tool results
+            response = await self.generate_response(self.history)
+            parts.append(response["content"])
         
-        return response
+        # Answers are kept without tool calls that were never run
+        self.history.append({"role": "assistant", "content": response["content"]})
+        self.history = trim_history(self.history, HISTORY_TOKEN_BUDGET)
+        return "\n\n".join(part for part in parts if part)
 
     async def chat_loop(self):
         """Run an interactive chat loop"""
@@ -218,8 +268,10 @@ Available tools:
                 if query.lower() == 'quit':
                     break
                 
+                prompt_tokens = self.prompt_tokens
                 response = await self.process_query(query)
                 print("\n" + response)
+                print(f"\n[Prompt tokens: {self.prompt_tokens - prompt_tokens}]")
 
             except Exception as e:
                 print(f"\nError: {str(e)}")
@@ -0,0 +1,45 @@
+"""Alembic environment: runs migrations against the application's database."""
+from logging.config import fileConfig
+
+from alembic import context
+
+from api.database import Base, DATABASE_URL, IS_SQLITE, engine
+# Import the models so their tables are registered on Base.metadata
+from api.input_api import models as input_models  # noqa: F401
+from api.llm_api import models as llm_models  # noqa: F401
+from api.jobs_api import models as job_models  # noqa: F401
+
+config = context.config
+
+# Leave logging alone when migrations run inside the application
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL without connecting to the database."""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=IS_SQLITE,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Apply the migrations over a connection from the application's engine."""
+    with engine.connect() as connection:
+        # SQLite can't alter most column properties in place, so use batch mode there
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=IS_SQLITE)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
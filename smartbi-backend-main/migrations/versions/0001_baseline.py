@@ -0,0 +1,45 @@
+"""Baseline: the csv_data and llm_interactions tables as originally created
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "csv_data",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("filename", sa.String()),
+        sa.Column("content", sa.Text()),
+        sa.Column("source_type", sa.String()),
+    )
+    op.create_index("ix_csv_data_id", "csv_data", ["id"])
+    op.create_index("ix_csv_data_filename", "csv_data", ["filename"])
+
+    op.create_table(
+        "llm_interactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("prompt", sa.Text(), nullable=False),
+        sa.Column("response", sa.Text(), nullable=False),
+        sa.Column("prompt_type", sa.String(), nullable=False),
+        sa.Column("image_data", sa.LargeBinary(), nullable=True),
+        sa.Column("image_filename", sa.String(), nullable=True),
+        sa.Column("timestamp", sa.DateTime()),
+        sa.Column("model_used", sa.String(), nullable=True),
+        sa.Column("processing_time", sa.Integer(), nullable=True),
+    )
+    op.create_index("ix_llm_interactions_id", "llm_interactions", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("llm_interactions")
+    op.drop_table("csv_data")
@@ -0,0 +1,73 @@
+"""Content store hashes, Parquet dtypes, history index and the LLM response cache
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Databases created with create_all before migrations existed may already have
+some of these columns, so each change is only applied when it is missing. In
+offline mode (--sql) there is no database to inspect, and the SQL is written
+for a database at the 0001 baseline.
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = None if context.is_offline_mode() else sa.inspect(op.get_bind())
+
+    def add_columns(table, columns):
+        existing = {column["name"] for column in inspector.get_columns(table)} if inspector else set()
+        for column in columns:
+            if column.name not in existing:
+                op.add_column(table, column)
+
+    def add_index(name, table, columns):
+        existing = {index["name"] for index in inspector.get_indexes(table)} if inspector else set()
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+    # Legacy rows keep their content column; new rows only reference the content store
+    add_columns("csv_data", [
+        sa.Column("content_hash", sa.String(64), nullable=True),
+        sa.Column("size_bytes", sa.Integer(), nullable=True),
+        sa.Column("row_count", sa.Integer(), nullable=True),
+        sa.Column("columnar_dtypes", sa.Text(), nullable=True),
+    ])
+    add_index("ix_csv_data_content_hash", "csv_data", ["content_hash"])
+
+    add_columns("llm_interactions", [
+        sa.Column("image_hash", sa.String(64), nullable=True),
+    ])
+    add_index("ix_llm_interactions_image_hash", "llm_interactions", ["image_hash"])
+    add_index("ix_llm_interactions_timestamp_id", "llm_interactions", ["timestamp", "id"])
+
+    if not (inspector and inspector.has_table("llm_cache_entries")):
+        op.create_table(
+            "llm_cache_entries",
+            sa.Column("key", sa.String(64), primary_key=True),
+            sa.Column("response", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_llm_cache_entries_expires_at", "llm_cache_entries", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("llm_cache_entries")
+    op.drop_index("ix_llm_interactions_timestamp_id", "llm_interactions")
+    op.drop_index("ix_llm_interactions_image_hash", "llm_interactions")
+    with op.batch_alter_table("llm_interactions") as batch:
+        batch.drop_column("image_hash")
+    op.drop_index("ix_csv_data_content_hash", "csv_data")
+    with op.batch_alter_table("csv_data") as batch:
+        batch.drop_column("columnar_dtypes")
+        batch.drop_column("row_count")
+        batch.drop_column("size_bytes")
+        batch.drop_column("content_hash")
@@ -0,0 +1,46 @@
+"""Conversation sessions and their messages
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "conversation_sessions",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("model_name", sa.String(), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=True),
+        sa.Column("summary_tokens", sa.Integer(), nullable=False),
+        sa.Column("window_tokens", sa.Integer(), nullable=False),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_table(
+        "conversation_messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("session_id", sa.String(32), sa.ForeignKey("conversation_sessions.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("tokens", sa.Integer(), nullable=False),
+        sa.Column("summarized", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_conversation_messages_session_id_id", "conversation_messages", ["session_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_conversation_messages_session_id_id", "conversation_messages")
+    op.drop_table("conversation_messages")
+    op.drop_table("conversation_sessions")
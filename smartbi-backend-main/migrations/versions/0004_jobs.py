@@ -0,0 +1,51 @@
+"""Background jobs
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("request_hash", sa.String(64), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("result", sa.Text(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("cancel_requested", sa.Boolean(), nullable=False),
+        sa.Column("worker_id", sa.String(), nullable=True),
+        sa.Column("available_at", sa.DateTime(), nullable=False),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_jobs_status_available_at", "jobs", ["status", "available_at"])
+    op.create_index("ix_jobs_request_hash", "jobs", ["request_hash"])
+    op.create_index(
+        "ux_jobs_active_request_hash", "jobs", ["request_hash"],
+        unique=True,
+        sqlite_where=sa.text("status IN ('queued', 'running')"),
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_jobs_active_request_hash", "jobs")
+    op.drop_index("ix_jobs_request_hash", "jobs")
+    op.drop_index("ix_jobs_status_available_at", "jobs")
+    op.drop_table("jobs")
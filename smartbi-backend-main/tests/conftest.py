@@ -0,0 +1,56 @@
+"""
+Shared test setup.
+Settings are read once, when the api package is imported, so the environment
+is pointed at a throwaway database and file store before any test imports it.
+Tests that need a different database run code in a fresh interpreter.
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix="smartbi-tests-")
+atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(TEST_DIR, 'database.db')}",
+    "SMARTBI_STORAGE_DIR": os.path.join(TEST_DIR, "storage"),
+    "GROQ_API_KEY": "test",
+    "GROQ_RATE_LIMIT_STATE": "",
+    "MCP_DATAFRAME_SPILL_DIR": os.path.join(TEST_DIR, "dataframes"),
+})
+sys.path.insert(0, BACKEND_DIR)
+# The MCP server modules import their siblings directly
+sys.path.insert(0, os.path.join(BACKEND_DIR, "api", "mcp_server"))
+
+
+@pytest.fixture
+def backend():
+    """Return a function that runs Python code in the backend against another database and returns its output."""
+    def run(code: str, database_url: str, **env) -> str:
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=BACKEND_DIR,
+            env=dict(os.environ, DATABASE_URL=database_url, **env),
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+    return run
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client of the app, with the test database migrated on startup."""
+    from fastapi.testclient import TestClient
+
+    from api.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
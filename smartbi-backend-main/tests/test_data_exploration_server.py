@@ -0,0 +1,22 @@
+import asyncio
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    pytest.importorskip("mcp")
+    # The server writes its log under the working directory when first imported
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("data_exploration_server")
+
+
+def test_load_csv_reads_urls_eagerly(server, tmp_path):
+    path = tmp_path / "remote.csv"
+    path.write_text("a,b\n1,2\n3,4\n")
+
+    message = asyncio.run(server.load_csv(path.as_uri(), "remote"))
+
+    assert message.startswith(f"Successfully loaded {path.as_uri()} as 'remote'")
+    assert server.dataframes.get("remote")["b"].sum() == 6
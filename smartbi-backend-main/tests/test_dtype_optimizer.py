@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from dtype_optimizer import optimize_dtypes
+
+
+def test_arithmetic_on_optimized_integers_does_not_wrap_around():
+    df = optimize_dtypes(pd.DataFrame({"small": [1, 42, 100], "large": [1, 2, 3_000_000_000]}))
+
+    assert df["small"].dtype == np.int32
+    assert df["large"].dtype == np.int64
+    assert (df["small"] * 3).max() == 300
+    assert (df["small"] * 1000 - 200_000).min() == -199_000
+    assert (df["large"] * 3).max() == 9_000_000_000
+    assert df["small"].sum() == 143
+
+
+def test_only_text_with_full_dates_becomes_datetimes():
+    times = ["10:30", "11:45", "23:59:59"]
+    month_days = ["12/25", "1/31", "7/4"]
+    df = optimize_dtypes(pd.DataFrame({
+        "iso": ["2024-01-31", "2024-02-01 10:30", None],
+        "spelled_out": ["31-Jan-2024", "1 February 2024", "Mar 5, 2024"],
+        "times": times,
+        "month_days": month_days,
+    }))
+
+    assert df["iso"].iloc[1] == pd.Timestamp("2024-02-01 10:30")
+    assert df["spelled_out"].iloc[2] == pd.Timestamp("2024-03-05")
+    # No date part to parse: these would get today's date or year filled in
+    assert list(df["times"]) == times
+    assert list(df["month_days"]) == month_days
@@ -0,0 +1,21 @@
+import io
+
+import pytest
+from PIL import Image
+
+from api.image_processing import split_into_bands
+from api.settings import IMAGE_MAX_SIDE, TABLE_BAND_HEIGHT, TABLE_BAND_OVERLAP, TABLE_IMAGE_MAX_WIDTH
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("width, height", [(2400, 1400), (2400, 1500), (3000, 9000), (800, 1110)])
+def test_table_bands_fit_the_vision_model_by_default(width, height):
+    bands = split_into_bands(png(width, height), TABLE_IMAGE_MAX_WIDTH, TABLE_BAND_HEIGHT, TABLE_BAND_OVERLAP)
+
+    for band_bytes, _ in bands:
+        assert max(Image.open(io.BytesIO(band_bytes)).size) <= IMAGE_MAX_SIDE
@@ -0,0 +1,12 @@
+def upload(client, name: str, content: bytes) -> dict:
+    response = client.post("/api/input/upload-csv/", files={"file": (name, content, "text/csv")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_listing_and_details_agree(client):
+    uploaded = upload(client, "numbers.csv", b"n,label\n1,a\n2,b\n")
+    assert uploaded["columnar_dtypes"]
+
+    listed = {item["id"]: item for item in client.get("/api/input/csv/", params={"limit": 1000}).json()}
+    assert listed[uploaded["id"]] == client.get(f"/api/input/csv/{uploaded['id']}").json()
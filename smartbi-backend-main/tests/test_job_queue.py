@@ -0,0 +1,47 @@
+import json
+
+STOP_WHILE_RUNNING = """
+import asyncio
+import json
+from api.database import AsyncSessionLocal, init_db
+from api.jobs_api.models import Job
+from api.jobs_api.queue import JobQueue, enqueue, job_handler
+
+init_db()
+events = []
+
+@job_handler("wait")
+async def wait(payload, db):
+    events.append("started")
+    try:
+        await asyncio.sleep(60)
+    except asyncio.CancelledError:
+        await asyncio.sleep(0.1)  # Cleanup that takes a moment
+        events.append("cleaned up")
+        raise
+
+async def main():
+    queue = JobQueue(workers=1)
+    await queue.start()
+    async with AsyncSessionLocal() as db:
+        job, _ = await enqueue(db, "wait", {})
+    queue.notify()
+    while not events:
+        await asyncio.sleep(0.05)
+    await queue.stop()
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    async with AsyncSessionLocal() as db:
+        status = (await db.get(Job, job.id)).status
+    print(json.dumps({"events": events, "pending": len(pending), "status": status}))
+
+asyncio.run(main())
+"""
+
+
+def test_stopping_the_queue_stops_running_handlers(tmp_path, backend):
+    report = json.loads(backend(STOP_WHILE_RUNNING, f"sqlite:///{tmp_path / 'jobs.db'}").splitlines()[-1])
+
+    assert report["events"] == ["started", "cleaned up"]
+    assert report["pending"] == 0
+    # Left running, so another worker picks it up when the lease expires
+    assert report["status"] == "running"
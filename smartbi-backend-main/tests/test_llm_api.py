@@ -0,0 +1,44 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from api.groq_client import get_groq_client
+from api.storage import csv_store
+
+
+def completion(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        model="test-model",
+    )
+
+
+@pytest.fixture
+def groq(client, monkeypatch):
+    """The shared Groq client, answering every completion with a fixed text."""
+    groq_client = get_groq_client()
+    create = AsyncMock(return_value=completion("an answer"))
+    monkeypatch.setattr(groq_client.client.chat.completions, "create", create)
+    monkeypatch.setattr(groq_client.cache, "enabled", False)
+    return create
+
+
+def test_batch_appends_csv_content_and_reports_unreadable_files_per_item(client, groq):
+    readable = client.post("/api/input/upload-csv/", files={"file": ("a.csv", b"x,y\n1,2\n", "text/csv")}).json()
+    missing = client.post("/api/input/upload-csv/", files={"file": ("b.csv", b"x,z\n3,4\n", "text/csv")}).json()
+    os.remove(csv_store.path_for(csv_store.put_bytes(b"x,z\n3,4\n")))
+
+    response = client.post("/api/llm/prompt/batch", json={"items": [
+        {"prompt": "Summarize", "csv_id": readable["id"]},
+        {"prompt": "Summarize", "csv_id": missing["id"]},
+    ]})
+
+    assert response.status_code == 200
+    first, second = response.json()["results"]
+    assert first["error"] is None and first["interaction"]["response"] == "an answer"
+    assert second["interaction"] is None and second["error"].startswith(f"Could not read CSV data {missing['id']}")
+    prompt = groq.call_args.kwargs["messages"][0]["content"]
+    assert "CSV data from a.csv" in prompt and "1,2" in prompt
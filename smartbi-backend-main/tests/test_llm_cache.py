@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+from api.database import init_db
+from api.llm_cache import ResponseCache
+
+
+def test_persisted_entries_are_read_and_written_off_the_event_loop(monkeypatch):
+    init_db()
+    cache = ResponseCache(persist=True, enabled=True)
+    threads = []
+
+    def recording(method):
+        def run(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+        return run
+
+    monkeypatch.setattr(cache, "_load_persisted", recording(cache._load_persisted))
+    monkeypatch.setattr(cache, "_save_persisted", recording(cache._save_persisted))
+
+    async def scenario():
+        key = cache.make_key("model", "prompt", 0.0)
+        await cache.set(key, "answer")
+        # A fresh cache (another worker, or after a restart) finds the persisted entry
+        cache._entries.clear()
+        cache._size = 0
+        return threading.get_ident(), await cache.get(key)
+
+    loop_thread, response = asyncio.run(scenario())
+    assert response == "answer"
+    assert len(threads) == 2 and loop_thread not in threads
+    asyncio.run(cache.clear())